@@ -0,0 +1,173 @@
+import queue
+import threading
+import time
+from datetime import datetime
+import database
+import rollups
+
+WRITE_RETRIES = 5  # intentos por lote antes de descartarlo
+WRITE_RETRY_DELAY = 0.5  # segundos; se duplica en cada reintento
+
+
+def format_db_datetime(value):
+    """Fecha/hora local con milisegundos, el formato de activaciones."""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def parse_db_datetime(value):
+    """Acepta fechas guardadas con o sin milisegundos."""
+    return datetime.fromisoformat(value)
+
+
+class ActivationJournal(threading.Thread):
+    """
+    Único escritor de la tabla activaciones (y de sus resúmenes en rollups).
+
+    Los eventos de inicio/fin se encolan sin bloquear (`record_start`,
+    `record_end`) y este hilo los escribe con una conexión propia, agrupando
+    en una sola transacción todo lo acumulado durante `flush_interval`
+    segundos o hasta `max_batch` eventos. Así el fsync del SD se paga una vez
+    por lote y no una vez por producto levantado.
+
+    `on_commit()` se invoca desde este hilo después de cada lote confirmado.
+    Si un lote falla (por ejemplo SQLITE_BUSY pasado el busy_timeout) se
+    reintenta con espera creciente; solo se descarta tras WRITE_RETRIES
+    intentos, con un error que detalla cada evento perdido.
+    """
+
+    def __init__(self, db_path, tz, flush_interval=0.5, max_batch=50, logger=None,
+                 on_commit=None):
+        super().__init__(name='activation-journal', daemon=True)
+        self.db_path = db_path
+        self.tz = tz
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.logger = logger
+        self.on_commit = on_commit
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        # sensor_id -> (activation_id, start_time) de activaciones abiertas
+        self._open = {}
+
+    def record_start(self, sensor_id, when):
+        self._queue.put(('start', sensor_id, when))
+
+    def record_end(self, sensor_id, when):
+        self._queue.put(('end', sensor_id, when))
+
+    def stop(self, timeout=None):
+        """Escribe lo pendiente y detiene el hilo."""
+        self._queue.put(None)
+        self.join(timeout)
+
+    def run(self):
+        conn = database.connect(self.db_path)
+        try:
+            while not self._stopped.is_set():
+                batch = self._next_batch()
+                if batch:
+                    self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=1.0)
+        except queue.Empty:
+            return []
+        if first is None:
+            self._stopped.set()
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event is None:
+                self._stopped.set()
+                break
+            batch.append(event)
+        return batch
+
+    def _write(self, conn, batch):
+        delay = WRITE_RETRY_DELAY
+        for attempt in range(1, WRITE_RETRIES + 1):
+            # La transacción se revierte entera si falla: las activaciones
+            # abiertas vuelven a como estaban antes del lote
+            open_before = dict(self._open)
+            try:
+                with conn:
+                    c = conn.cursor()
+                    for kind, sensor_id, when in batch:
+                        if kind == 'start':
+                            self._insert_start(c, sensor_id, when)
+                        else:
+                            self._complete(c, sensor_id, when)
+            except Exception as e:
+                self._open = open_before
+                if attempt < WRITE_RETRIES:
+                    self._log_error(f"Error al escribir {len(batch)} eventos de activación "
+                                    f"(intento {attempt}/{WRITE_RETRIES}), reintentando: {e}")
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                lost = ', '.join(f"{kind} sensor {sensor_id} {format_db_datetime(when)}"
+                                 for kind, sensor_id, when in batch)
+                self._log_error(f"ACTIVACIONES PERDIDAS tras {WRITE_RETRIES} intentos: "
+                                f"{len(batch)} eventos descartados ({lost}): {e}")
+                return
+            break
+        if self.on_commit:
+            self.on_commit()
+
+    def _insert_start(self, c, sensor_id, when):
+        c.execute('''
+            INSERT INTO activaciones
+            (sensor_id, timestamp, start_time)
+            VALUES (?, ?, ?)
+        ''', (sensor_id, format_db_datetime(when), format_db_datetime(when)))
+        self._open[sensor_id] = (c.lastrowid, when)
+        rollups.record_start(c, sensor_id, when)
+        self._log_info(f"Nueva activación registrada: Sensor {sensor_id}")
+
+    def _complete(self, c, sensor_id, when):
+        open_activation = self._open.pop(sensor_id, None)
+        if open_activation is None:
+            # Activación abierta antes de iniciar este proceso
+            c.execute('''
+                SELECT id, start_time
+                FROM activaciones
+                WHERE sensor_id = ? AND completed = 0
+                ORDER BY timestamp DESC LIMIT 1
+            ''', (sensor_id,))
+            result = c.fetchone()
+            if not result or not result[1]:
+                return
+            open_activation = (result[0], self.tz.localize(parse_db_datetime(result[1])))
+
+        activation_id, start_dt = open_activation
+        duration = int((when - start_dt).total_seconds() * 1000)
+        c.execute('''
+            UPDATE activaciones
+            SET end_time = ?,
+                duration = ?,
+                completed = 1
+            WHERE id = ?
+        ''', (format_db_datetime(when), duration, activation_id))
+        rollups.record_completion(c, sensor_id, start_dt, duration)
+        self._log_info(f"Activación completada: Sensor {sensor_id}, Duración {duration}ms")
+
+    def _log_info(self, message):
+        if self.logger:
+            self.logger.info(message)
+
+    def _log_error(self, message):
+        if self.logger:
+            self.logger.error(message)
+        else:
+            print(message)
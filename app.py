@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for, Response, send_file
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, Response, send_file, stream_with_context
 import RPi.GPIO as GPIO
 import sqlite3
 import os
@@ -9,12 +9,23 @@ import csv
 from io import StringIO, BytesIO
 from werkzeug.utils import secure_filename
 import functools
+import atexit
 import psutil
 import subprocess
 import pandas as pd
 import json
 import pytz
 import logging
+from collections import deque
+from sensor_handler import SensorHandler, SensorSampler
+from activation_journal import ActivationJournal, parse_db_datetime
+from response_cache import ResponseCache
+from catalog import Catalog
+import media
+import media_registry
+import database
+import rollups
+import report_outbox
 
 
 logging.basicConfig(level=logging.INFO)
@@ -27,32 +38,124 @@ app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB
 santiago_tz = pytz.timezone('America/Santiago')
 
 # Configuración
-UPLOAD_FOLDER = '/home/pi/vitrina/static/videos'
+UPLOAD_FOLDER = media_registry.VIDEOS_FOLDER  # /home/pi/vitrina/static/videos
 ALLOWED_EXTENSIONS = {'mp4', 'webm', 'mov'}
 SENSOR_PINS = [17, 27, 5, 6, 13, 18, 22, 26, 19]
+SENSOR_SAMPLE_INTERVAL = 0.02  # segundos entre lecturas GPIO (50 Hz) sin interrupciones
+SENSOR_EDGE_DETECTION = True  # usar interrupciones GPIO (add_event_detect) si el kernel lo permite
+SENSOR_BOUNCETIME_MS = 50  # antirrebote por hardware para cada flanco
+ACTIVATION_FLUSH_INTERVAL = 0.5  # segundos máximos que un evento espera su commit
+ACTIVATION_FLUSH_BATCH = 50  # eventos por transacción
+SENSOR_STREAM_KEEPALIVE = 15  # segundos entre comentarios keep-alive del stream SSE
+# Segundos que se reutiliza cada respuesta de lectura del dashboard y el panel.
+# Las escrituras invalidan antes; el TTL acota lo viejo que puede ser un dato
+# que depende de la hora (p.ej. "última hora").
+CACHE_TTL = {
+    'dashboard_stats': 5,
+    'stats': 5,
+    'hourly_analysis': 30,
+    'metrics': 60,
+    'assignment_history': 30,
+    'activations': 10,
+}
+
+MEDIA_MAX_AGE = 365 * 24 * 3600  # URLs de /media con ?v=<hash> nunca cambian de contenido
+REPORT_HISTORY_SIZE = 50  # intentos de reporte que se conservan en memoria
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Variables globales
-previous_active_sensors = []
 current_mode = 1  # Valor por defecto
+sensor_handler = None
+sensor_sampler = None
+activation_journal = None
+response_cache = ResponseCache()
+catalog = Catalog()
+ipc_listener = None
+job_status = {}  # tarea -> último estado informado por el proceso de tareas
+report_attempts = deque(maxlen=REPORT_HISTORY_SIZE)  # últimos envíos de activaciones
 
 def setup_gpio():
-    GPIO.setmode(GPIO.BCM)
-    for pin in SENSOR_PINS:
-        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-
-def get_db_connection():
-    try:
-        conn = sqlite3.connect('/home/pi/vitrina/vitrina.db')
-        conn.row_factory = sqlite3.Row
-        return conn
-    except Exception as e:
-        print(f"Error al conectar con la base de datos: {e}")
-        raise
+    global sensor_handler
+    sensor_handler = SensorHandler(SENSOR_PINS)
+
+def start_sensor_sampler(interval=SENSOR_SAMPLE_INTERVAL):
+    """Inicia el hilo que mantiene en memoria el estado de los sensores."""
+    global sensor_sampler
+    if sensor_sampler is None:
+        sensor_sampler = SensorSampler(sensor_handler, interval=interval,
+                                       on_change=handle_sensor_transition,
+                                       edge_detection=SENSOR_EDGE_DETECTION,
+                                       bouncetime=SENSOR_BOUNCETIME_MS)
+        sensor_sampler.start()
+    return sensor_sampler
+
+def start_activation_journal():
+    """Inicia (una sola vez) el hilo escritor de activaciones."""
+    global activation_journal
+    if activation_journal is None:
+        activation_journal = ActivationJournal(database.DB_PATH, santiago_tz,
+                                               flush_interval=ACTIVATION_FLUSH_INTERVAL,
+                                               max_batch=ACTIVATION_FLUSH_BATCH,
+                                               logger=app.logger,
+                                               on_commit=invalidate_activations)
+        activation_journal.start()
+        atexit.register(activation_journal.stop, 2)
+    return activation_journal
+
+def invalidate_activations():
+    response_cache.invalidate('activaciones')
+
+def handle_catalog_change(tables, version):
+    # Las respuestas cacheadas que cruzan con estas tablas quedan obsoletas
+    response_cache.invalidate(*tables)
+
+catalog.subscribe(handle_catalog_change)
+# Los registros de media hechos en este proceso recargan el catálogo directo
+media_registry.change_handler = catalog.refresh
+
+def video_display_name(video_path):
+    """Nombre con que se subió el video (los archivos se guardan por hash), sin extensión."""
+    name = catalog.video_name(video_path)
+    return name.rsplit('.', 1)[0] if name else None
+
+def catalog_response(key, build):
+    """
+    Respuesta JSON con ETag fuerte de la versión del catálogo. Si el cliente
+    ya tiene esa versión (If-None-Match) se responde 304 sin serializar nada;
+    si no, se sirven los bytes ya serializados para esta versión.
+    """
+    etag = catalog.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(catalog.serialized(key, build), mimetype='application/json')
+    response.set_etag(etag)
+    # El navegador guarda la respuesta pero revalida en cada petición
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def get_sensor_snapshot():
+    if sensor_sampler is not None:
+        return sensor_sampler.snapshot
+    # Sin muestreador (p.ej. scripts de prueba): lectura directa
+    return sensor_handler.read_snapshot()
+
+def handle_sensor_transition(active_sensors, previous_sensors, timestamp):
+    app.logger.info(f"Cambio en vitrina - Anterior: {previous_sensors}, Actual: {active_sensors}")
+    register_sensor_activity(active_sensors, previous_sensors,
+                             datetime.fromtimestamp(timestamp, santiago_tz))
+
+def get_db_connection(row_factory=None):
+    """
+    Conexión prestada del pool compartido (WAL, caché y mmap configurados en
+    database.py). Usar siempre con `with`: hace commit al salir del bloque y
+    devuelve la conexión al pool.
+    """
+    return database.connection(row_factory)
 
 def init_db():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+    with get_db_connection() as conn:
         c = conn.cursor()
                 # Mapeo correcto de sensores
         sensor_mapping = {
@@ -91,6 +194,8 @@ def init_db():
                 a.*,
                 es.nombre_fantasia,
                 sv.video_path,
+                (SELECT mf.name FROM media_files mf WHERE mf.video_path = sv.video_path
+                 ORDER BY mf.updated_at DESC LIMIT 1) as video_name,
                 ROUND(CAST((strftime('%s', end_time) - strftime('%s', start_time)) AS FLOAT), 2) as duration_seconds
             FROM activaciones a
             LEFT JOIN etiquetas_sensores es ON a.sensor_id = es.gpio_pin
@@ -168,13 +273,6 @@ def init_db():
             video_path TEXT
         )''')
         
-        # Tabla de métricas diarias
-        c.execute('''CREATE TABLE IF NOT EXISTS metrics_daily (
-            date TEXT PRIMARY KEY,
-            total_activations INTEGER,
-            sensor_data TEXT
-        )''')
-        
         # Tabla de estadísticas por hora
         c.execute('''CREATE TABLE IF NOT EXISTS sensor_stats_hourly (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -194,6 +292,8 @@ def init_db():
                 a.*,
                 es.nombre_fantasia,
                 sv.video_path,
+                (SELECT mf.name FROM media_files mf WHERE mf.video_path = sv.video_path
+                 ORDER BY mf.updated_at DESC LIMIT 1) as video_name,
                 ROUND(CAST((strftime('%s', end_time) - strftime('%s', start_time)) AS FLOAT), 2) as duration_seconds
             FROM activaciones a
             LEFT JOIN etiquetas_sensores es ON a.sensor_id = es.gpio_pin
@@ -203,6 +303,12 @@ def init_db():
 
         conn.commit()
 
+        # Índices y demás cambios de esquema versionados
+        database.migrate(conn)
+        database.check_query_plans(conn, app.logger)
+
+    catalog.load()
+
 
 def login_required(f):
     @functools.wraps(f)
@@ -226,27 +332,28 @@ def login_page():
 @login_required
 def panel():
     try:
-        conn = sqlite3.connect('/home/pi/vitrina/vitrina.db')
-        cursor = conn.cursor()
-        
-        # Obtener información de los sensores
-        cursor.execute('''
-            SELECT s.gpio_pin, s.sensor_numero, s.nombre_fantasia, v.video_path 
-            FROM etiquetas_sensores s 
-            LEFT JOIN sensor_videos v ON s.gpio_pin = v.sensor_id
-            ORDER BY s.sensor_numero
-        ''')
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Obtener información de los sensores
+            cursor.execute('''
+                SELECT s.gpio_pin, s.sensor_numero, s.nombre_fantasia, v.video_path 
+                FROM etiquetas_sensores s 
+                LEFT JOIN sensor_videos v ON s.gpio_pin = v.sensor_id
+                ORDER BY s.sensor_numero
+            ''')
+            rows = cursor.fetchall()
         
         sensors = []
-        for row in cursor.fetchall():
+        for row in rows:
             sensors.append({
                 'gpio_pin': row[0],  # gpio_pin
                 'sensor_numero': row[1],  # sensor_numero
                 'nombre_fantasia': row[2] if row[2] else '',  # nombre_fantasia
-                'video_path': row[3] if row[3] else None  # video_path
+                'video_path': row[3] if row[3] else None,  # video_path
+                'video_name': video_display_name(row[3]) if row[3] else None
             })
             
-        conn.close()
         return render_template('panel.html', sensors=sensors)
         
     except Exception as e:
@@ -261,9 +368,6 @@ def download_stats():
         from_date = request.args.get('from')
         to_date = request.args.get('to')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # Mapeo de GPIO a números de fantasía
         gpio_to_fantasy = {
             '27': '1', '17': '2', '5': '3', '6': '4',
@@ -284,8 +388,10 @@ def download_stats():
         ORDER BY a.timestamp DESC
         """
         
-        cursor.execute(query_activaciones, (from_date, to_date))
-        results = cursor.fetchall()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query_activaciones, (from_date, to_date))
+            results = cursor.fetchall()
 
         # Crear DataFrame principal
         df = pd.DataFrame(results, columns=['Sensor GPIO', 'Fecha/Hora', 'Nombre Fantasia', 'Video Path'])
@@ -302,9 +408,7 @@ def download_stats():
             if pd.isna(nombre) or nombre == '':
                 video_path = row['Video Path']
                 if pd.notna(video_path) and video_path:
-                    # Extraer el nombre del archivo sin la extensión
-                    video_name = video_path.split('/')[-1]
-                    nombre = video_name.rsplit('.', 1)[0]  # Eliminar la extensión .mp4
+                    nombre = video_display_name(video_path)
             
             # Si aún no hay nombre, usar solo el número del sensor
             if pd.isna(nombre) or nombre == '':
@@ -425,9 +529,6 @@ def download_stats():
             'error': 'Error al generar el archivo de estadísticas',
             'details': str(e)
         }), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 @app.route('/api/export-stats')
 @login_required
@@ -442,7 +543,7 @@ def export_stats():
             from_date = today.replace(hour=0, minute=0, second=0).strftime('%Y-%m-%d %H:%M:%S')
             to_date = today.replace(hour=23, minute=59, second=59).strftime('%Y-%m-%d %H:%M:%S')
         
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             query = '''
                 SELECT 
                     es.sensor_numero,
@@ -507,58 +608,14 @@ def export_stats():
 
 
 
-def update_hourly_stats():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        today = datetime.now().date()
-        
-        # Calcular estadísticas por hora para el día actual
-        c.execute('''
-            INSERT OR REPLACE INTO sensor_stats_hourly 
-            (sensor_id, hour, date, total_activations, avg_duration)
-            SELECT 
-                sensor_id,
-                CAST(strftime('%H', timestamp) AS INTEGER) as hour,
-                date(timestamp) as date,
-                COUNT(*) as total_activations,
-                AVG(CASE WHEN duration > 0 
-                    THEN CAST(duration AS FLOAT) / 1000 
-                    ELSE NULL END) as avg_duration
-            FROM activaciones
-            WHERE date(timestamp) = date('now')
-            GROUP BY sensor_id, hour, date(timestamp)
-        ''')
-        
-        # Marcar horas pico
-        c.execute('''
-            WITH HourlyRank AS (
-                SELECT 
-                    *,
-                    RANK() OVER (PARTITION BY sensor_id, date 
-                               ORDER BY total_activations DESC) as rank
-                FROM sensor_stats_hourly
-                WHERE date = ?
-            )
-            UPDATE sensor_stats_hourly 
-            SET peak_hour = (
-                SELECT CASE WHEN rank = 1 THEN 1 ELSE 0 END 
-                FROM HourlyRank hr 
-                WHERE hr.sensor_id = sensor_stats_hourly.sensor_id
-                AND hr.hour = sensor_stats_hourly.hour
-                AND hr.date = sensor_stats_hourly.date
-            )
-            WHERE date = ?
-        ''', (today, today))
-        
-        conn.commit()
-
 @app.route('/api/hourly-analysis')
 @login_required
+@response_cache.cached(CACHE_TTL['hourly_analysis'], tags=('activaciones', 'etiquetas_sensores'))
 def get_hourly_analysis():
     try:
         date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Análisis por hora
@@ -569,7 +626,9 @@ def get_hourly_analysis():
                     es.nombre_fantasia,
                     s.total_activations,
                     s.avg_duration,
-                    s.peak_hour
+                    RANK() OVER (
+                        PARTITION BY s.sensor_id ORDER BY s.total_activations DESC
+                    ) = 1 as peak_hour
                 FROM sensor_stats_hourly s
                 LEFT JOIN etiquetas_sensores es ON s.sensor_id = es.gpio_pin
                 WHERE s.date = ?
@@ -599,122 +658,58 @@ def get_hourly_analysis():
         app.logger.error(f"Error en análisis horario: {str(e)}")
         return jsonify({'error': str(e)}), 500
     
-def update_daily_metrics():
-    try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            
-            # Crear tabla si no existe
-            c.execute('''CREATE TABLE IF NOT EXISTS metrics_daily
-                        (date TEXT PRIMARY KEY,
-                         total_activations INTEGER,
-                         sensor_data TEXT)''')
-            
-            # Obtener fecha actual en Santiago
-            santiago_tz = pytz.timezone('America/Santiago')
-            today = datetime.now(santiago_tz).strftime('%Y-%m-%d')
-            
-            # Calcular métricas del día
-            c.execute('''
-                SELECT sensor_id, COUNT(*) as count
-                FROM activaciones
-                WHERE date(timestamp) = date(?)
-                AND completed = 1
-                GROUP BY sensor_id
-            ''', (today,))
-            
-            sensor_data = dict(c.fetchall())
-            total_activations = sum(sensor_data.values())
-            
-            # Actualizar o insertar métricas
-            c.execute('''
-                INSERT OR REPLACE INTO metrics_daily (date, total_activations, sensor_data)
-                VALUES (?, ?, ?)
-            ''', (today, total_activations, json.dumps(sensor_data)))
-            
-            conn.commit()
-            
-    except Exception as e:
-        app.logger.error(f"Error updating daily metrics: {str(e)}")
-
-
 @app.route('/api/metrics/daily-summary', methods=['GET'])
 @login_required
 def get_daily_metrics_summary():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
-            today = datetime.now().date()
+            today = datetime.now(santiago_tz).date()
+            yesterday = (today - timedelta(days=1)).strftime('%Y-%m-%d')
+            today = today.strftime('%Y-%m-%d')
             
-            # Calcular métricas diarias
-            c.execute('''
-                INSERT OR REPLACE INTO metrics_daily 
-                (date, sensor_id, total_activations, total_duration, avg_duration, 
-                 peak_hour, peak_hour_activations, completion_rate, video_path)
-                SELECT 
-                    DATE(a.timestamp) as date,
-                    a.sensor_id,
-                    COUNT(*) as total_activations,
-                    SUM(duration) as total_duration,
-                    AVG(CASE WHEN duration > 0 THEN duration ELSE NULL END) as avg_duration,
-                    CAST(strftime('%H', timestamp) as INTEGER) as peak_hour,
-                    MAX(hourly_counts.count) as peak_activations,
-                    ROUND(CAST(SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END) as FLOAT) / 
-                          COUNT(*) * 100, 2) as completion_rate,
-                    sv.video_path
-                FROM activaciones a
-                LEFT JOIN sensor_videos sv ON a.sensor_id = sv.sensor_id
-                LEFT JOIN (
-                    SELECT 
-                        sensor_id,
-                        strftime('%H', timestamp) as hour,
-                        COUNT(*) as count
-                    FROM activaciones
-                    WHERE DATE(timestamp) = ?
-                    GROUP BY sensor_id, hour
-                ) hourly_counts ON a.sensor_id = hourly_counts.sensor_id
-                WHERE DATE(a.timestamp) = ?
-                GROUP BY DATE(a.timestamp), a.sensor_id
-            ''', (today, today))
-            
-            # Obtener resumen del día
+            # Resumen del día desde sensor_stats_daily (mantenida por rollups)
             c.execute('''
-                SELECT 
-                    m.*,
+                WITH horas AS (
+                    SELECT sensor_id, hour, total_activations,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY sensor_id
+                               ORDER BY total_activations DESC, hour
+                           ) as puesto
+                    FROM sensor_stats_hourly
+                    WHERE date = ?
+                )
+                SELECT
+                    d.date,
+                    d.sensor_id,
+                    d.total_activations,
+                    d.total_duration,
+                    CAST(d.total_duration AS FLOAT) / NULLIF(d.completed_activations, 0) as avg_duration,
+                    h.hour as peak_hour,
+                    h.total_activations as peak_hour_activations,
+                    ROUND(CAST(d.completed_activations AS FLOAT) /
+                          NULLIF(d.total_activations, 0) * 100, 2) as completion_rate,
+                    sv.video_path,
                     es.nombre_fantasia,
-                    es.sensor_numero
-                FROM metrics_daily m
-                LEFT JOIN etiquetas_sensores es ON m.sensor_id = es.gpio_pin
-                WHERE m.date = ?
-                ORDER BY m.total_activations DESC
-            ''', (today,))
+                    es.sensor_numero,
+                    ROUND(((d.total_activations - COALESCE(y.total_activations, 0)) * 100.0) /
+                          NULLIF(y.total_activations, 0), 2) as trend
+                FROM sensor_stats_daily d
+                LEFT JOIN horas h ON h.sensor_id = d.sensor_id AND h.puesto = 1
+                LEFT JOIN sensor_videos sv ON d.sensor_id = sv.sensor_id
+                LEFT JOIN etiquetas_sensores es ON d.sensor_id = es.gpio_pin
+                LEFT JOIN sensor_stats_daily y ON y.sensor_id = d.sensor_id AND y.date = ?
+                WHERE d.date = ?
+                ORDER BY d.total_activations DESC
+            ''', (today, yesterday, today))
             
             columns = [col[0] for col in c.description]
             metrics = [dict(zip(columns, row)) for row in c.fetchall()]
-            
-            # Calcular tendencias comparando con día anterior
-            c.execute('''
-                WITH YesterdayMetrics AS (
-                    SELECT sensor_id, total_activations
-                    FROM metrics_daily
-                    WHERE date = date('now', '-1 day')
-                )
-                SELECT 
-                    m.sensor_id,
-                    ROUND(((m.total_activations - COALESCE(y.total_activations, 0)) * 100.0) / 
-                          NULLIF(y.total_activations, 0), 2) as trend
-                FROM metrics_daily m
-                LEFT JOIN YesterdayMetrics y ON m.sensor_id = y.sensor_id
-                WHERE m.date = date('now')
-            ''')
-            
-            trends = {row[0]: row[1] for row in c.fetchall()}
-            
             for metric in metrics:
-                metric['trend'] = trends.get(metric['sensor_id'], 0)
+                metric['trend'] = metric['trend'] or 0
             
             return jsonify({
-                'date': today.strftime('%Y-%m-%d'),
+                'date': today,
                 'metrics': metrics
             })
             
@@ -725,7 +720,7 @@ def get_daily_metrics_summary():
 def load_system_config():
     global current_mode
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('SELECT value FROM system_config WHERE key = ?', ('versus_mode',))
             result = c.fetchone()
@@ -746,7 +741,7 @@ def get_detailed_report():
             from_date = today.replace(hour=0, minute=0, second=0).strftime('%Y-%m-%d %H:%M:%S')
             to_date = today.replace(hour=23, minute=59, second=59).strftime('%Y-%m-%d %H:%M:%S')
             
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Estadísticas por hora
@@ -793,7 +788,7 @@ def register_activation():
             return jsonify({'error': 'sensor_id es requerido'}), 400
 
         # Obtener el video_path asociado al sensor
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('SELECT video_path FROM sensor_videos WHERE sensor_id = ?', (sensor_id,))
             result = c.fetchone()
@@ -814,7 +809,11 @@ def register_activation():
                 completed,
                 video_path
             ))
+            rollups.record_start(c, sensor_id, current_time)
+            if completed:
+                rollups.record_completion(c, sensor_id, current_time, duration)
             conn.commit()
+        invalidate_activations()
 
         return jsonify({'success': True, 'message': 'Activación registrada correctamente'})
     
@@ -823,7 +822,7 @@ def register_activation():
         return jsonify({'error': str(e)}), 500
 
 def register_video_change(sensor_id, old_video, new_video):
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+    with get_db_connection() as conn:
         c = conn.cursor()
         current_time = datetime.now()
         
@@ -862,9 +861,10 @@ def login():
 
 @app.route('/api/metrics')
 @login_required
+@response_cache.cached(CACHE_TTL['metrics'], tags=('activaciones', 'etiquetas_sensores'))
 def get_detailed_metrics():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Métricas por video
@@ -924,7 +924,7 @@ def update_sensor_name():
         if not sensor_id or new_name is None:
             return jsonify({'error': 'Se requiere sensor_id y new_name'}), 400
             
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('''
                 UPDATE etiquetas_sensores 
@@ -956,7 +956,7 @@ def monitor():
 @login_required
 def remove_sensor_video(sensor_id):
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Obtener el video actual
@@ -968,13 +968,9 @@ def remove_sensor_video(sensor_id):
                 # Eliminar el registro de la base de datos
                 c.execute('DELETE FROM sensor_videos WHERE sensor_id = ?', (sensor_id,))
                 conn.commit()
-                
-                # Eliminar el archivo si existe
-                try:
-                    if os.path.exists(video_path):
-                        os.remove(video_path)
-                except Exception as e:
-                    print(f"Error al eliminar archivo: {str(e)}")
+                catalog.refresh('sensor_videos')
+                # El archivo puede estar compartido con otro sensor o con la
+                # playlist de fondo: si quedó sin referencias lo borra media_gc
                 
                 return jsonify({'success': True, 'message': 'Video eliminado correctamente'})
             else:
@@ -998,21 +994,11 @@ def upload_background_video():
 
     try:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        print(f"Archivo guardado en: {filepath}")
-        
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            # Obtener el máximo orden actual
-            c.execute('SELECT MAX(orden) FROM background_videos')
-            max_orden = c.fetchone()[0] or 0
-            
-            # Insertar el nuevo video
-            c.execute('INSERT INTO background_videos (video_path, orden) VALUES (?, ?)',
-                     (os.path.join('videos', filename), max_orden + 1))
-            inserted_id = c.lastrowid 
-            conn.commit()
+        # Se recibe en un temporal y se registra con rename atómico
+        tmp_path = media_registry.incoming_path(filename)
+        file.save(tmp_path)
+        inserted_id, video_path = media_registry.register_background_video(tmp_path, filename)
+        print(f"Archivo guardado en: {video_path}")
 
         return jsonify({'success': True, 'id': inserted_id})
     except Exception as e:
@@ -1024,19 +1010,14 @@ def upload_background_video():
 #@login_required
 def remove_background_video(video_id):
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             # Obtener ruta del video
             c.execute('SELECT video_path FROM background_videos WHERE id = ?', (video_id,))
             result = c.fetchone()
             
             if result:
-                video_path = os.path.join(app.config['UPLOAD_FOLDER'], 
-                                        os.path.basename(result[0]))
-                # Eliminar archivo si existe
-                if os.path.exists(video_path):
-                    os.remove(video_path)
-                    
+                # El archivo lo borra media_gc si ningún otro registro lo usa
                 # Eliminar registro
                 c.execute('DELETE FROM background_videos WHERE id = ?', (video_id,))
                 
@@ -1051,6 +1032,7 @@ def remove_background_video(video_id):
                 ''', (video_id, video_id))
                 
                 conn.commit()
+                catalog.refresh('background_videos')
                 return jsonify({'success': True})
                 
         return jsonify({'error': 'Video no encontrado'}), 404
@@ -1064,7 +1046,7 @@ def remove_background_video(video_id):
 @login_required
 def check_activaciones():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Obtener las últimas 50 activaciones
@@ -1101,27 +1083,7 @@ def check_activaciones():
 
 @app.route('/api/etiquetas-sensores', methods=['GET'])
 def obtener_etiquetas_sensores():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        c.execute('''
-            SELECT 
-                gpio_pin,
-                sensor_numero,
-                nombre_fantasia,
-                silenciado
-            FROM etiquetas_sensores
-        ''')
-        resultados = c.fetchall()
-        etiquetas = [
-            {
-                'gpio_pin': gpio_pin,
-                'sensor_numero': sensor_numero,
-                'nombre_fantasia': nombre_fantasia,
-                'silenciado': silenciado
-            }
-            for gpio_pin, sensor_numero, nombre_fantasia, silenciado in resultados
-        ]
-        return jsonify(etiquetas)
+    return catalog_response('etiquetas', catalog.etiquetas)
 
 @app.route('/api/actualizar-etiqueta', methods=['POST'])
 # @login_required
@@ -1132,60 +1094,28 @@ def actualizar_etiqueta_sensor():
     if not gpio_pin:
         return jsonify({'error': 'Falta el número de GPIO'}), 400
         
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        c.execute('''
-            UPDATE etiquetas_sensores 
-            SET nombre_fantasia = ?
-            WHERE gpio_pin = ?
-        ''', (nombre_fantasia, gpio_pin))
-        conn.commit()
+    media_registry.set_sensor_label(gpio_pin, nombre_fantasia)
     return jsonify({'success': True})
 
 @app.route('/api/background_videos')
 def get_background_videos():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        # Añadir COALESCE para manejar valores NULL en orden
-        c.execute('''
-            SELECT id, video_path, COALESCE(orden, 0) as orden 
-            FROM background_videos 
-            ORDER BY orden ASC
-        ''')
-        videos = [
-            {
-                'id': row[0], 
-                'video_path': row[1], 
-                'orden': row[2]
-            } 
-            for row in c.fetchall()
-        ]
-        # Añadir logging para debug
-        print("Returning background videos:", videos)
-        return jsonify(videos)
+    return jsonify(catalog.background_videos())
 
 @app.route('/api/sensor_videos')
 @login_required
 def get_all_sensor_videos():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        c.execute('''
-            SELECT 
-                sv.sensor_id, 
-                sv.video_path,
-                COALESCE(es.nombre_fantasia, es.sensor_numero) as nombre_sensor,
-                es.nombre_fantasia
-            FROM sensor_videos sv 
-            LEFT JOIN etiquetas_sensores es ON sv.sensor_id = es.gpio_pin
-            ORDER BY sv.sensor_id
-        ''')
-        videos = [{
-            'sensor_id': row[0],
-            'video_path': row[1],
-            'nombre_sensor': row[2],
-            'nombre_fantasia': row[3]
-        } for row in c.fetchall()]
-        return jsonify(videos)
+    snapshot = catalog.snapshot
+    videos = []
+    for sensor_id, video_path in snapshot.sensor_videos.items():
+        etiqueta = snapshot.etiquetas.get(sensor_id, {})
+        videos.append({
+            'sensor_id': sensor_id,
+            'video_path': video_path,
+            'nombre_sensor': catalog.sensor_name(sensor_id, snapshot),
+            'video_name': catalog.video_name(video_path, snapshot),
+            'nombre_fantasia': etiqueta.get('nombre_fantasia')
+        })
+    return jsonify(videos)
 
 @app.route('/api/upload_video', methods=['POST'])
 # @login_required   
@@ -1204,26 +1134,12 @@ def upload_video():
             return jsonify({'error': 'No selected file'}), 400
             
         if file:
-            # Asegurarse de que el directorio existe
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            
-            # Asegurar el nombre del archivo
+            # Se recibe en un temporal y se registra con rename atómico:
+            # el kiosko nunca lee un archivo a medio escribir
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            # Simplemente sobrescribir el archivo si existe
-            file.save(filepath)
-            
-            # Actualizar la base de datos
-            with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-                c = conn.cursor()
-                
-                # Actualizar o insertar el nuevo video
-                video_path = os.path.join('videos', filename)
-                c.execute('''INSERT OR REPLACE INTO sensor_videos (sensor_id, video_path) 
-                           VALUES (?, ?)''', (sensor_id, video_path))
-                
-                conn.commit()
+            tmp_path = media_registry.incoming_path(filename)
+            file.save(tmp_path)
+            video_path = media_registry.register_sensor_video(tmp_path, sensor_id, filename)
                 
             return jsonify({
                 'success': True,
@@ -1248,11 +1164,12 @@ def update_versus_mode():
         if mode is None:
             return jsonify({'error': 'Mode is required'}), 400
 
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('UPDATE system_config SET value = ? WHERE key = ?', 
                      (str(mode), 'versus_mode'))
             conn.commit()
+        catalog.refresh('system_config')
             
         return jsonify({'success': True})
     except Exception as e:
@@ -1263,12 +1180,8 @@ def update_versus_mode():
 @app.route('/api/get-current-mode')
 def get_current_mode():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            c.execute('SELECT value FROM system_config WHERE key = ?', ('versus_mode',))
-            result = c.fetchone()
-            mode = int(result[0]) if result else current_mode
-            return jsonify({'mode': mode})
+        mode = catalog.config('versus_mode')
+        return jsonify({'mode': int(mode) if mode is not None else current_mode})
     except Exception as e:
         print(f"Error al obtener modo actual: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -1277,13 +1190,15 @@ def get_current_mode():
 @login_required
 def reset_stats():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
-            # Limpiar tabla de activaciones
+            # Limpiar tabla de activaciones y sus resúmenes
             c.execute('DELETE FROM activaciones')
+            rollups.clear(c)
             # Limpiar tabla de versus
             c.execute('DELETE FROM versus')
             conn.commit()
+        invalidate_activations()
             
         return jsonify({
             'success': True, 
@@ -1301,16 +1216,7 @@ def reset_stats():
 
 @app.route('/api/system-config')
 def get_system_config():
-    try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            c.execute('SELECT key, value FROM system_config')
-            config = dict(c.fetchall())
-            app.logger.info(f"Configuración actual del sistema: {config}")
-            return jsonify(config)
-    except Exception as e:
-        app.logger.error(f"Error en system_config: {str(e)}")
-        return jsonify({'error': 'Error al obtener configuración'}), 500
+    return catalog_response('system_config', catalog.config)
 
 @app.route('/api/update-sensor-name', methods=['POST'])
 @login_required
@@ -1323,14 +1229,7 @@ def update_sensor_name():
         if not sensor_id or not new_name:
             return jsonify({'error': 'Faltan datos requeridos'}), 400
             
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            c.execute('''
-                UPDATE etiquetas_sensores 
-                SET nombre_fantasia = ? 
-                WHERE gpio_pin = ?
-            ''', (new_name, sensor_id))
-            conn.commit()
+        media_registry.set_sensor_label(sensor_id, new_name)
             
         app.logger.info(f"Nombre de sensor actualizado: {sensor_id} -> {new_name}")
         return jsonify({'success': True, 'message': 'Nombre actualizado correctamente'})
@@ -1352,20 +1251,26 @@ def handleSensorChange(activeSensors):
 
 @app.route('/api/stats')
 @login_required
+@response_cache.cached(CACHE_TTL['stats'], tags=('activaciones', 'etiquetas_sensores'))
 def get_stats():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
-            # Obtener fecha actual en Santiago
-            today = datetime.now(santiago_tz).strftime('%Y-%m-%d')
+            # Límites del día actual y de los últimos 7 días en Santiago
+            today = datetime.now(santiago_tz).date()
+            day_start, day_end = database.day_bounds(today)
+            days_start = database.day_bounds(today - timedelta(days=7))[0]
             
             # Obtener total de activaciones
             c.execute('SELECT COUNT(*) FROM activaciones WHERE completed = 1')
             total_activations = c.fetchone()[0]
             
             # Obtener activaciones de hoy
-            c.execute('SELECT COUNT(*) FROM activaciones WHERE date(timestamp) = ? AND completed = 1', (today,))
+            c.execute('''
+                SELECT COUNT(*) FROM activaciones
+                WHERE completed = 1 AND timestamp >= ? AND timestamp < ?
+            ''', (day_start, day_end))
             today_activations = c.fetchone()[0]
             
             # Obtener activaciones por sensor
@@ -1382,10 +1287,10 @@ def get_stats():
                 SELECT date(timestamp) as date, COUNT(*) as count
                 FROM activaciones
                 WHERE completed = 1
-                AND date(timestamp) >= date('now', '-7 days')
+                AND timestamp >= ? AND timestamp < ?
                 GROUP BY date(timestamp)
                 ORDER BY date(timestamp)
-            ''')
+            ''', (days_start, day_end))
             daily_data = dict(c.fetchall())
             
             stats = {
@@ -1409,11 +1314,12 @@ def toggle_debug():
         data = request.json
         enabled = data.get('enabled', False)
         
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('UPDATE system_config SET value = ? WHERE key = ?', 
                      (str(enabled).lower(), 'debug_enabled'))
             conn.commit()
+        catalog.refresh('system_config')
         
         return jsonify({'success': True, 'debug_enabled': enabled})
     except Exception as e:
@@ -1423,47 +1329,47 @@ def toggle_debug():
 
 last_status_update = {}  # Variable global para trackear última actualización por sensor
 
+@app.route('/media/<path:filename>')
+def serve_media(filename):
+    """
+    Videos con soporte de Range (send_file condicional) y caché del navegador.
+    Con `?v=` igual al hash actual el contenido es inmutable y Chromium lo
+    reutiliza en cada vuelta de la playlist sin volver a pedirlo; sin versión
+    (o con una vieja) se revalida contra el ETag, que es el sha256.
+    Solo sirve videos de VIDEOS_FOLDER: ni el resto de static/ ni los
+    temporales de subidas y descargas (.<nombre>...) ni los sidecars.
+    """
+    path = media.media_path(filename)
+    name = os.path.basename(path) if path else ''
+    if (not path or not path.startswith(os.path.realpath(media_registry.VIDEOS_FOLDER) + os.sep)
+            or name.startswith('.') or name.endswith(media.SIDECAR_SUFFIX)):
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    meta = media.metadata(path)
+    if meta is None:
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+
+    immutable = request.args.get('v') == meta['sha256'][:media.URL_HASH_LENGTH]
+    response = send_file(path, conditional=True, etag=meta['sha256'])
+    if immutable:
+        response.headers['Cache-Control'] = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/public/sensor_videos')
 def get_public_sensor_videos():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        c.execute('''
-            SELECT 
-                sv.sensor_id, 
-                sv.video_path,
-                COALESCE(es.nombre_fantasia, es.sensor_numero) as nombre
-            FROM sensor_videos sv 
-            LEFT JOIN etiquetas_sensores es ON sv.sensor_id = es.gpio_pin
-        ''')
-        videos = [{'sensor_id': row[0], 
-                  'video_path': row[1],
-                  'nombre': row[2]} for row in c.fetchall()]
-        return jsonify(videos)
+    return catalog_response('sensor_videos', catalog.sensor_videos)
     
 @app.route('/api/public/sensor_video/<int:sensor_id>')
 def get_public_sensor_video(sensor_id):
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        c.execute('''
-            SELECT sv.video_path, COALESCE(es.nombre_fantasia, es.sensor_numero) as nombre
-            FROM sensor_videos sv 
-            LEFT JOIN etiquetas_sensores es ON sv.sensor_id = es.gpio_pin 
-            WHERE sv.sensor_id = ?
-        ''', (sensor_id,))
-        result = c.fetchone()
-        return jsonify({
-            'video_path': result[0] if result else None,
-            'nombre': result[1] if result else None
-        })
+    # Camino crítico de cada levantamiento: se responde desde memoria
+    return catalog_response(
+        f'sensor_video/{sensor_id}',
+        lambda: catalog.sensor_video(sensor_id) or {'video_path': None, 'nombre': None})
 
 @app.route('/api/public/background_videos')
 def get_public_background_videos():
-    with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-        c = conn.cursor()
-        c.execute('SELECT id, video_path, orden FROM background_videos ORDER BY orden')
-        videos = [{'id': row[0], 'video_path': row[1], 'orden': row[2]} 
-                 for row in c.fetchall()]
-        return jsonify(videos)
+    return catalog_response('background_videos', catalog.background_videos)
 
 @app.route('/api/move_background', methods=['POST'])
 #@login_required
@@ -1473,33 +1379,7 @@ def move_background_video():
         video_id = data.get('video_id')
         direction = data.get('direction')
         
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            # Obtener orden actual
-            c.execute('SELECT orden FROM background_videos WHERE id = ?', (video_id,))
-            current_order = c.fetchone()[0]
-            
-            if direction == 'up' and current_order > 1:
-                # Intercambiar con el video anterior
-                c.execute('''
-                    UPDATE background_videos 
-                    SET orden = CASE
-                        WHEN orden = ? THEN orden - 1
-                        WHEN orden = ? - 1 THEN orden + 1
-                    END
-                    WHERE orden IN (?, ? - 1)
-                ''', (current_order, current_order, current_order, current_order))
-            elif direction == 'down':
-                c.execute('''
-                    UPDATE background_videos 
-                    SET orden = CASE
-                        WHEN orden = ? THEN orden + 1
-                        WHEN orden = ? + 1 THEN orden - 1
-                    END
-                    WHERE orden IN (?, ? + 1)
-                ''', (current_order, current_order, current_order, current_order))
-            
-            conn.commit()
+        media_registry.move_background_video(video_id, direction)
         return jsonify({'success': True})
     except Exception as e:
         app.logger.error(f"Error moviendo video: {str(e)}")
@@ -1508,7 +1388,7 @@ def move_background_video():
 @app.route('/api/extra-content')
 def get_extra_content():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('''SELECT content_path, position, content_type 
                         FROM extra_content 
@@ -1532,6 +1412,14 @@ def get_extra_content():
 
 
 #monitor de recursos 
+@app.route('/api/cache-stats')
+@login_required
+def get_cache_stats():
+    """Aciertos/fallos de la caché de respuestas, para ajustar CACHE_TTL."""
+    if request.args.get('reset') == '1':
+        response_cache.reset_stats()
+    return jsonify(response_cache.stats())
+
 @app.route('/api/system_info')
 def system_info():
     cpu_percent = psutil.cpu_percent()
@@ -1581,6 +1469,7 @@ def get_uptime():
 
 @app.route('/api/dashboard-stats', methods=['GET'])
 @login_required
+@response_cache.cached(CACHE_TTL['dashboard_stats'], tags=('activaciones', 'sensor_videos', 'etiquetas_sensores', 'media_files'))
 def get_dashboard_stats():
     try:
         from_date = request.args.get('from')
@@ -1590,112 +1479,110 @@ def get_dashboard_stats():
             to_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             from_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
 
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            cursor = conn.cursor()
+        today_start, today_end = database.period_bounds('today')
+        one_hour_ago = (datetime.now(santiago_tz) - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+        week_start, week_end = database.period_bounds('week')
+        month_start, month_end = database.period_bounds('month')
 
-            # 1. Total activaciones en el período
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM activaciones 
-                WHERE timestamp BETWEEN ? AND ?
-            """, (from_date, to_date))
-            total_activaciones = cursor.fetchone()[0]
-
-            # 2. Activaciones de hoy
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM activaciones 
-                WHERE date(timestamp) = date('now')
-            """)
-            activaciones_hoy = cursor.fetchone()[0]
+        # Los KPI de hoy/semana/mes salen de sensor_stats_daily (fechas YYYY-MM-DD)
+        kpi_bounds = {
+            'today_start': today_start[:10], 'today_end': today_end[:10],
+            'week_start': week_start[:10], 'week_end': week_end[:10],
+            'month_start': month_start[:10], 'month_end': month_end[:10],
+        }
 
-            # 3. Activaciones última semana
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM activaciones 
-                WHERE timestamp >= datetime('now', '-7 days')
-            """)
-            activaciones_semana = cursor.fetchone()[0]
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-            # 4. Activaciones este mes
+            # 2-4. KPI de períodos fijos desde el resumen diario
             cursor.execute("""
-                SELECT COUNT(*) 
-                FROM activaciones 
-                WHERE strftime('%Y-%m', timestamp) = strftime('%Y-%m', 'now')
-            """)
-            activaciones_mes = cursor.fetchone()[0]
-
-            # 5. Activaciones por sensor
+                SELECT
+                    COALESCE(SUM(CASE WHEN date >= :today_start AND date < :today_end
+                        THEN total_activations END), 0),
+                    COALESCE(SUM(CASE WHEN date >= :week_start AND date < :week_end
+                        THEN total_activations END), 0),
+                    COALESCE(SUM(CASE WHEN date >= :month_start AND date < :month_end
+                        THEN total_activations END), 0)
+                FROM sensor_stats_daily
+                WHERE date >= MIN(:week_start, :month_start)
+                  AND date < MAX(:today_end, :week_end, :month_end)
+            """, kpi_bounds)
+            activaciones_hoy, activaciones_semana, activaciones_mes = cursor.fetchone()
+
+            # 1, 5-7. El período pedido es arbitrario (fecha y hora), así que
+            # se cuenta sobre activaciones, por sensor y día
             cursor.execute("""
-                SELECT 
-                    a.sensor_id,
+                WITH agregado AS (
+                    SELECT
+                        sensor_id,
+                        date(timestamp) as fecha,
+                        COUNT(*) as en_periodo,
+                        MAX(timestamp) as ultima
+                    FROM activaciones
+                    WHERE timestamp BETWEEN :from_date AND :to_date
+                    GROUP BY sensor_id, fecha
+                )
+                SELECT
+                    ag.sensor_id,
                     s.nombre_fantasia,
                     sv.video_path,
-                    COUNT(*) as total
-                FROM activaciones a
-                LEFT JOIN sensores s ON a.sensor_id = s.gpio_pin
-                LEFT JOIN sensor_videos sv ON a.sensor_id = sv.sensor_id
-                WHERE a.timestamp BETWEEN ? AND ?
-                GROUP BY a.sensor_id, s.nombre_fantasia, sv.video_path
-                ORDER BY total DESC
-            """, (from_date, to_date))
-            
-            activaciones_por_sensor = []
+                    ag.fecha,
+                    ag.en_periodo,
+                    datetime(ag.ultima, 'localtime') as ultima_activacion
+                FROM agregado ag
+                LEFT JOIN sensores s ON ag.sensor_id = s.gpio_pin
+                LEFT JOIN sensor_videos sv ON ag.sensor_id = sv.sensor_id
+            """, {'from_date': from_date, 'to_date': to_date})
+
+            total_activaciones = 0
+            por_sensor = {}
+            por_dia = {}
             for row in cursor.fetchall():
-                sensor_id, nombre_fantasia, video_path, total = row
-                nombre_display = nombre_fantasia if nombre_fantasia else (
-                    video_path.split('/')[-1].replace('.mp4', '') if video_path else f'Sensor {sensor_id}'
-                )
-                activaciones_por_sensor.append({
-                    'sensor_id': sensor_id,
-                    'nombre_fantasia': nombre_display,
-                    'total': total
-                })
+                (sensor_id, nombre_fantasia, video_path, fecha,
+                 en_periodo, ultima_activacion) = row
+                total_activaciones += en_periodo
+
+                por_dia[fecha] = por_dia.get(fecha, 0) + en_periodo
+                sensor = por_sensor.get(sensor_id)
+                if sensor is None:
+                    video_name = video_display_name(video_path)
+                    nombre_display = nombre_fantasia or video_name or f'Sensor {sensor_id}'
+                    sensor = por_sensor[sensor_id] = {
+                        'sensor_id': sensor_id,
+                        'nombre_fantasia': nombre_display,
+                        'video_path': video_path,
+                        'video_name': video_name,
+                        'total': 0,
+                        'ultima_activacion': None
+                    }
+                sensor['total'] += en_periodo
+                if ultima_activacion and (sensor['ultima_activacion'] is None
+                                          or ultima_activacion > sensor['ultima_activacion']):
+                    sensor['ultima_activacion'] = ultima_activacion
+
+            sensores_ordenados = sorted(por_sensor.values(), key=lambda item: item['total'], reverse=True)
+
+            # 5. Activaciones por sensor
+            activaciones_por_sensor = [{
+                'sensor_id': item['sensor_id'],
+                'nombre_fantasia': item['nombre_fantasia'],
+                'video_path': item['video_path'],
+                'video_name': item['video_name'],
+                'total': item['total']
+            } for item in sensores_ordenados]
 
             # 6. Activaciones por día
-            cursor.execute("""
-                SELECT 
-                    date(timestamp) as fecha,
-                    COUNT(*) as total
-                FROM activaciones
-                WHERE timestamp BETWEEN ? AND ?
-                GROUP BY date(timestamp)
-                ORDER BY fecha
-            """, (from_date, to_date))
-            
             activaciones_por_dia = [
-                {'fecha': row[0], 'total': row[1]}
-                for row in cursor.fetchall()
+                {'fecha': fecha, 'total': total}
+                for fecha, total in sorted(por_dia.items())
             ]
 
-            # 7. Ranking de sensores (nuevo)
-            cursor.execute("""
-                SELECT 
-                    a.sensor_id,
-                    s.nombre_fantasia,
-                    sv.video_path,
-                    COUNT(*) as total,
-                    MAX(datetime(a.timestamp, 'localtime')) as ultima_activacion
-                FROM activaciones a
-                LEFT JOIN sensores s ON a.sensor_id = s.gpio_pin
-                LEFT JOIN sensor_videos sv ON a.sensor_id = sv.sensor_id
-                WHERE a.timestamp BETWEEN ? AND ?
-                GROUP BY a.sensor_id, s.nombre_fantasia, sv.video_path
-                ORDER BY total DESC
-                LIMIT 10
-            """, (from_date, to_date))
-            
-            ranking = []
-            for row in cursor.fetchall():
-                sensor_id, nombre_fantasia, video_path, total, ultima_activacion = row
-                nombre_display = nombre_fantasia if nombre_fantasia else (
-                    video_path.split('/')[-1].replace('.mp4', '') if video_path else f'Sensor {sensor_id}'
-                )
-                ranking.append({
-                    'nombre': nombre_display,
-                    'total': total,
-                    'ultima_activacion': ultima_activacion
-                })
+            # 7. Ranking de sensores, derivado del resultado por sensor
+            ranking = [{
+                'nombre': item['nombre_fantasia'],
+                'total': item['total'],
+                'ultima_activacion': item['ultima_activacion']
+            } for item in sensores_ordenados[:10]]
 
             # 8. Activaciones recientes (actualizado)
             cursor.execute("""
@@ -1707,10 +1594,10 @@ def get_dashboard_stats():
                 FROM activaciones a
                 LEFT JOIN sensores s ON a.sensor_id = s.gpio_pin
                 LEFT JOIN sensor_videos sv ON a.sensor_id = sv.sensor_id
-                WHERE a.timestamp >= datetime('now', '-1 hour', 'localtime')
+                WHERE a.timestamp >= ?
                 ORDER BY a.timestamp DESC
                 LIMIT 20
-            """)
+            """, (one_hour_ago,))
 
             activaciones_recientes = []
             for row in cursor.fetchall():
@@ -1732,9 +1619,7 @@ def get_dashboard_stats():
                 nombre_sensor = f'Sensor {sensor_numero}'
                 
                 # Obtener el nombre del producto desde nombre_fantasia o video_path
-                producto_nombre = nombre_fantasia if nombre_fantasia else (
-                    video_path.split('/')[-1].replace('.mp4', '') if video_path else 'Sin nombre'
-                )
+                producto_nombre = nombre_fantasia or video_display_name(video_path) or 'Sin nombre'
                 
                 activaciones_recientes.append({
                     'sensor': nombre_sensor,
@@ -1760,9 +1645,10 @@ def get_dashboard_stats():
 
 @app.route('/api/assignment-history')
 @login_required
+@response_cache.cached(CACHE_TTL['assignment_history'], tags=('activaciones', 'sensor_videos', 'etiquetas_sensores', 'media_files'))
 def get_assignment_history():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('''
                 WITH RankedAssignments AS (
@@ -1790,6 +1676,8 @@ def get_assignment_history():
                 'sensor_id': row[0],
                 'nombre': row[1],
                 'video': row[2],
+                'video_path': row[2],
+                'video_name': video_display_name(row[2]),
                 'fecha_inicio': row[3],
                 'fecha_fin': row[4] or 'Actual',
                 'total_activaciones': row[5]
@@ -1832,7 +1720,7 @@ def update_extra_content():
         file.save(content_path)
         
         # Actualizar la base de datos
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             c.execute('''
                 INSERT INTO extra_content (content_path, position, content_type) 
@@ -1851,24 +1739,26 @@ def update_extra_content():
 
 @app.route('/api/activations')
 @login_required
+@response_cache.cached(CACHE_TTL['activations'], tags=('activaciones',))
 def get_activations():
     try:
-        conn = sqlite3.connect('/home/pi/vitrina/vitrina.db')
-        cursor = conn.cursor()
-        
-        # Obtener activaciones de los últimos 7 días
-        cursor.execute('''
-            SELECT 
-                strftime('%Y-%m-%d', timestamp) as fecha,
-                sensor_id,
-                COUNT(*) as activaciones
-            FROM activaciones
-            WHERE timestamp >= date('now', '-7 days')
-            GROUP BY fecha, sensor_id
-            ORDER BY fecha DESC, sensor_id
-        ''')
-        
-        rows = cursor.fetchall()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            days_start = database.day_bounds(datetime.now(santiago_tz).date() - timedelta(days=7))[0]
+            
+            # Obtener activaciones de los últimos 7 días
+            cursor.execute('''
+                SELECT 
+                    strftime('%Y-%m-%d', timestamp) as fecha,
+                    sensor_id,
+                    COUNT(*) as activaciones
+                FROM activaciones
+                WHERE timestamp >= ?
+                GROUP BY fecha, sensor_id
+                ORDER BY fecha DESC, sensor_id
+            ''', (days_start,))
+            
+            rows = cursor.fetchall()
         activations = []
         
         for row in rows:
@@ -1878,7 +1768,6 @@ def get_activations():
                 'count': row[2]
             })
         
-        conn.close()
         return jsonify({'success': True, 'activations': activations})
         
     except Exception as e:
@@ -1890,7 +1779,7 @@ def get_activations():
 @login_required
 def get_recent_activations():
     try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Obtener activaciones de la última hora
@@ -1946,7 +1835,7 @@ def register_sensor_activity():
         # Sensores que fueron retirados
         sensors_removed = previous_set - current_set
         
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
             
             # Completar activaciones de sensores retirados
@@ -1964,9 +1853,10 @@ def register_sensor_activity():
                 if result:
                     activation_id, start_time = result
                     if start_time:
-                        start_dt = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
+                        start_dt = santiago_tz.localize(parse_db_datetime(start_time))
                         duration = int((current_time - start_dt).total_seconds() * 1000)
                     else:
+                        start_dt = current_time
                         duration = 0
                         
                     c.execute('''
@@ -1976,6 +1866,7 @@ def register_sensor_activity():
                             completed = 1 
                         WHERE id = ?
                     ''', (current_time.strftime('%Y-%m-%d %H:%M:%S'), duration, activation_id))
+                    rollups.record_completion(c, sensor_id, start_dt, duration)
                     app.logger.info(f"✅ Activación completada: Sensor {sensor_id}, Duración {duration}ms")
             
             # Registrar nuevas activaciones
@@ -1990,9 +1881,11 @@ def register_sensor_activity():
                     current_time.strftime('%Y-%m-%d %H:%M:%S'),
                     current_time.strftime('%Y-%m-%d %H:%M:%S')
                 ))
+                rollups.record_start(c, sensor_id, current_time)
                 app.logger.info(f"📝 Nueva activación registrada: Sensor {sensor_id}")
             
             conn.commit()
+        invalidate_activations()
         
         return jsonify({'success': True})
         
@@ -2003,41 +1896,69 @@ def register_sensor_activity():
 @app.route('/api/public/sensor_status')
 def sensor_status():
     try:
-        global previous_active_sensors
-        current_time = datetime.now(santiago_tz)
-        active_sensors = []
-        
-        for pin in SENSOR_PINS:
-            state = GPIO.input(pin)
-            # Ahora activamos cuando es HIGH (cuando NO hay obstáculo)
-            if state == GPIO.HIGH:
-                active_sensors.append(pin)
-                app.logger.info(f"Producto retirado en sensor {pin}")
-        
-        # Logging para debug
-        app.logger.info(f"Sensores activos (productos retirados): {active_sensors}")
-        
-        # Registrar actividad si hay cambios
-        if set(active_sensors) != set(previous_active_sensors):
-            app.logger.info(f"Cambio en vitrina - Anterior: {previous_active_sensors}, Actual: {active_sensors}")
-            register_sensor_activity(active_sensors, previous_active_sensors)
-            
-        previous_active_sensors = active_sensors
-        
-        return jsonify({
-            'active_sensors': active_sensors,
-            'status': {str(pin): GPIO.input(pin) for pin in SENSOR_PINS},
-            'timestamp': current_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
+        # El muestreador mantiene el estado y registra los cambios; aquí solo
+        # se serializa la última fotografía, sin tocar el bus GPIO.
+        snapshot = get_sensor_snapshot()
+        sampled_at = sensor_sampler.sampled_at if sensor_sampler is not None else snapshot.timestamp
+        return jsonify(serialize_sensor_snapshot(snapshot, sampled_at))
     except Exception as e:
         app.logger.error(f"Error en sensor_status: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def serialize_sensor_snapshot(snapshot, sampled_at=None):
+    """
+    `timestamp` es la hora de la lectura (`sampled_at`; en el stream, la de
+    la transición) y `last_change` la de la última transición.
+    """
+    def format_time(value):
+        return datetime.fromtimestamp(value, santiago_tz).strftime('%Y-%m-%d %H:%M:%S')
+
+    return {
+        'seq': snapshot.seq,
+        'active_sensors': list(snapshot.active_sensors),
+        'status': {str(pin): state for pin, state in snapshot.status.items()},
+        'timestamp': format_time(sampled_at if sampled_at is not None else snapshot.timestamp),
+        'last_change': format_time(snapshot.timestamp)
+    }
+
+@app.route('/api/public/sensor_stream')
+def sensor_stream():
+    """
+    Server-Sent Events: un evento por transición de sensores, con `id` igual
+    al número de secuencia para que EventSource pueda reanudar con
+    Last-Event-ID. Al conectar se envía primero el estado actual.
+    """
+    if sensor_sampler is None:
+        return jsonify({'error': 'Muestreo de sensores no iniciado'}), 503
+
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_seq = -1
+    if last_seq > sensor_sampler.snapshot.seq:
+        # El servidor se reinició: la secuencia del cliente ya no es válida
+        last_seq = -1
+
+    def generate(last_seq):
+        yield "retry: 1000\n\n"
+        while True:
+            events = sensor_sampler.wait_for_events(last_seq, timeout=SENSOR_STREAM_KEEPALIVE)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for snapshot in events:
+                last_seq = snapshot.seq
+                payload = json.dumps(serialize_sensor_snapshot(snapshot))
+                yield f"id: {snapshot.seq}\nevent: sensors\ndata: {payload}\n\n"
+
+    return Response(stream_with_context(generate(last_seq)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/vitrina_status')
 def vitrina_status():
     status = {}
-    for pin in SENSOR_PINS:
-        state = GPIO.input(pin)
+    for pin, state in get_sensor_snapshot().status.items():
         status[pin] = {
             'estado': 'Producto retirado' if state == GPIO.HIGH else 'Producto en vitrina',
             'valor_sensor': 'HIGH' if state == GPIO.HIGH else 'LOW',
@@ -2045,70 +1966,27 @@ def vitrina_status():
         }
     return jsonify(status)
 
-def register_sensor_activity(active_sensors, previous_sensors):
-    conn = None
+def register_sensor_activity(active_sensors, previous_sensors, current_time=None):
+    """Encola inicio/fin de activaciones; el diario las escribe en lote."""
     try:
-        current_time = datetime.now(santiago_tz)
+        current_time = current_time or datetime.now(santiago_tz)
         current_set = set(active_sensors)
         previous_set = set(previous_sensors)
-        
-        conn = sqlite3.connect('/home/pi/vitrina/vitrina.db')
-        c = conn.cursor()
-        
+        journal = start_activation_journal()
+
         # Completar activaciones de sensores que ya no están activos
-        sensors_removed = previous_set - current_set
-        for sensor_id in sensors_removed:
-            c.execute('''
-                SELECT id, start_time 
-                FROM activaciones 
-                WHERE sensor_id = ? AND completed = 0 
-                ORDER BY timestamp DESC LIMIT 1
-            ''', (sensor_id,))
-            
-            result = c.fetchone()
-            if result:
-                activation_id, start_time = result
-                if start_time:
-                    # Convertir start_time a datetime con zona horaria
-                    start_dt = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
-                    start_dt = santiago_tz.localize(start_dt)
-                    duration = int((current_time - start_dt).total_seconds() * 1000)
-                    
-                    c.execute('''
-                        UPDATE activaciones 
-                        SET end_time = ?, 
-                            duration = ?,
-                            completed = 1 
-                        WHERE id = ?
-                    ''', (current_time.strftime('%Y-%m-%d %H:%M:%S'), duration, activation_id))
-                    app.logger.info(f"Activación completada: Sensor {sensor_id}, Duración {duration}ms")
-        
+        for sensor_id in previous_set - current_set:
+            journal.record_end(sensor_id, current_time)
+
         # Registrar nuevas activaciones
-        sensors_activated = current_set - previous_set
-        for sensor_id in sensors_activated:
-            c.execute('''
-                INSERT INTO activaciones 
-                (sensor_id, timestamp, start_time) 
-                VALUES (?, ?, ?)
-            ''', (
-                sensor_id, 
-                current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                current_time.strftime('%Y-%m-%d %H:%M:%S')
-            ))
-            app.logger.info(f"Nueva activación registrada: Sensor {sensor_id}")
-        
-        conn.commit()
+        for sensor_id in current_set - previous_set:
+            journal.record_start(sensor_id, current_time)
+
         return True
-        
+
     except Exception as e:
         app.logger.error(f"Error al registrar actividad: {str(e)}")
-        if conn:
-            conn.rollback()
         return False
-        
-    finally:
-        if conn:
-            conn.close()
 
 @app.route('/api/sensor-activation', methods=['POST'])
 def sensor_activation():
@@ -2123,7 +2001,7 @@ def sensor_activation():
         current_time = datetime.now()
 
         # Conectar a la base de datos
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
+        with get_db_connection() as conn:
             c = conn.cursor()
 
             # Buscar video asociado al sensor
@@ -2137,11 +2015,13 @@ def sensor_activation():
                 (sensor_id, timestamp, start_time, video_path) 
                 VALUES (?, ?, ?, ?)
             ''', (sensor_id, current_time, current_time, video_path))
+            rollups.record_start(c, sensor_id, current_time)
             
             # Obtener el ID de la última activación insertada
             activation_id = c.lastrowid
 
             conn.commit()
+        invalidate_activations()
 
         # Logging de la activación
         debugLog(f"Sensor {sensor_id} activado. Video: {video_path}")
@@ -2162,23 +2042,10 @@ def sensor_activation():
 
 @app.route('/api/get_sensor_video/<int:sensor_id>')
 def get_sensor_video(sensor_id):
-    try:
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            c = conn.cursor()
-            c.execute('SELECT video_path FROM sensor_videos WHERE sensor_id = ?', (sensor_id,))
-            result = c.fetchone()
-            
-            if result and result[0]:
-                return jsonify({'video_path': result[0]})
-            return jsonify({'error': 'No video found'}), 404
-            
-    except Exception as e:
-        app.logger.error(f"Error getting video path: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-            
-    except Exception as e:
-        app.logger.error(f"Error al registrar actividad: {str(e)}")
-        return False
+    video_path = catalog.snapshot.sensor_videos.get(sensor_id)
+    if video_path:
+        return jsonify({'video_path': video_path})
+    return jsonify({'error': 'No video found'}), 404
 
 @app.route('/credentials')
 def servir_json():
@@ -2189,37 +2056,64 @@ def servir_json():
         return jsonify({'mensaje': 'No existen credenciales'}), 404
 
 import threading
-from workers import send_data_to_server
-from cms import get_media
+import ipc
+import jobs
+
+def handle_ipc_message(message):
+    """Mensajes del proceso de tareas (ver ipc.py)."""
+    kind = message.get('type')
+    if kind == 'catalog':
+        catalog.refresh(*message['tables'])
+    elif kind == 'activations':
+        invalidate_activations()
+    elif kind == 'job_status':
+        job_status[message['job']] = message
+    elif kind == 'report_attempt':
+        report_attempts.append(message)
+
+def start_ipc_listener():
+    """Escucha avisos del proceso de tareas (`python -m vitrina jobs`)."""
+    global ipc_listener
+    if ipc_listener is None:
+        ipc_listener = ipc.EventListener(handle_ipc_message, logger=app.logger)
+        ipc_listener.start()
+        atexit.register(ipc_listener.close)
+    return ipc_listener
+
+@app.route('/api/jobs-status')
+@login_required
+def get_jobs_status():
+    """Última ejecución de cada tarea en segundo plano."""
+    return jsonify(job_status)
+
+@app.route('/api/report-attempts')
+@login_required
+def get_report_attempts():
+    """Últimos intentos de reporte de activaciones (el más reciente primero)."""
+    try:
+        backlog = report_outbox.backlog()
+    except sqlite3.Error as e:
+        app.logger.error(f"Error leyendo el outbox de reportes: {str(e)}")
+        backlog = None
+    return jsonify({'attempts': list(reversed(report_attempts)), 'backlog': backlog})
+
+def start_services():
+    """GPIO, base de datos, catálogo y los hilos de activaciones y sensores."""
+    setup_gpio()
+    init_db()
+    start_activation_journal()
+    start_sensor_sampler()
+    start_ipc_listener()
 
 def run_server():
+    # Servidor de desarrollo de Werkzeug; en producción usar `python -m vitrina run`
     try:
-        setup_gpio()
-        init_db()
+        start_services()
         app.run(host='0.0.0.0', port=5000, debug=False)
     except Exception as e:
         app.logger.error(f"Error en el servidor: {str(e)}")
         print(f"Error in Flask thread: {e}")
 
-def report_to_server():
-    try:
-        while True:
-            resp = send_data_to_server()
-            app.logger.error(str(resp))
-            time.sleep(600) # 10 minutos
-    except Exception as e:
-        app.logger.error(f"Error al reportar datos: {str(e)}")
-        print(f"Error in additional tasks thread: {e}")
-
-def sync_cms():
-    try:
-        while True:
-            get_media()
-            time.sleep(60)
-    except Exception as e:
-        app.logger.error(f"Error descargar media: {str(e)}")
-        print(f"Error descargar media: {e}")
-
 #credential_manager.clear_credentials()
 
 if __name__ == '__main__':
@@ -2232,12 +2126,9 @@ if __name__ == '__main__':
     flask_thread = threading.Thread(target=run_server, daemon=True)
     flask_thread.start()
 
-    additional_tasks_thread = threading.Thread(target=report_to_server, daemon=True)
-    additional_tasks_thread.start()
-
-    sync_cms_thread = threading.Thread(target=sync_cms, daemon=True)
-    sync_cms_thread.start()
+    # Modo de un solo proceso: las tareas corren como hilos junto al servidor
+    job_threads = jobs.start_threads()
 
     flask_thread.join()
-    additional_tasks_thread.join()
-    sync_cms_thread.join()
+    for thread in job_threads:
+        thread.join()
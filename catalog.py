@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import database
+import media
+
+# Fotografía inmutable de la configuración de contenido. Igual que
+# SensorSnapshot, se reemplaza completa en cada cambio: los lectores toman
+# `catalog.snapshot` una vez y nunca ven un estado a medio actualizar.
+CatalogSnapshot = namedtuple('CatalogSnapshot', [
+    'sensor_videos',      # {sensor_id: video_path}
+    'etiquetas',          # {gpio_pin: {'sensor_numero', 'nombre_fantasia', 'silenciado'}}
+    'background_videos',  # ({'id', 'video_path', 'orden'}, ...) ordenados por orden
+    'system_config',      # {key: value}
+    'media_names',        # {video_path: nombre lógico} (ver media_registry.py)
+    'version',
+])
+
+TABLES = ('sensor_videos', 'etiquetas_sensores', 'background_videos', 'system_config',
+          'media_files')
+
+
+def _load_sensor_videos(c):
+    c.execute('SELECT sensor_id, video_path FROM sensor_videos ORDER BY sensor_id')
+    return MappingProxyType(dict(c.fetchall()))
+
+
+def _load_etiquetas(c):
+    c.execute('''
+        SELECT gpio_pin, sensor_numero, nombre_fantasia, silenciado
+        FROM etiquetas_sensores
+    ''')
+    return MappingProxyType({
+        gpio_pin: MappingProxyType({
+            'sensor_numero': sensor_numero,
+            'nombre_fantasia': nombre_fantasia,
+            'silenciado': silenciado,
+        })
+        for gpio_pin, sensor_numero, nombre_fantasia, silenciado in c.fetchall()
+    })
+
+
+def _load_background_videos(c):
+    c.execute('''
+        SELECT id, video_path, COALESCE(orden, 0) as orden
+        FROM background_videos
+        ORDER BY orden ASC
+    ''')
+    return tuple(MappingProxyType({'id': row[0], 'video_path': row[1], 'orden': row[2]})
+                 for row in c.fetchall())
+
+
+def _load_system_config(c):
+    c.execute('SELECT key, value FROM system_config')
+    return MappingProxyType(dict(c.fetchall()))
+
+
+def _load_media_names(c):
+    # Si varios nombres apuntan al mismo archivo, gana el más reciente
+    c.execute('SELECT video_path, name FROM media_files ORDER BY updated_at')
+    return MappingProxyType(dict(c.fetchall()))
+
+
+# tabla -> (campo de CatalogSnapshot, función de carga)
+_LOADERS = {
+    'sensor_videos': ('sensor_videos', _load_sensor_videos),
+    'etiquetas_sensores': ('etiquetas', _load_etiquetas),
+    'background_videos': ('background_videos', _load_background_videos),
+    'system_config': ('system_config', _load_system_config),
+    'media_files': ('media_names', _load_media_names),
+}
+
+
+class Catalog:
+    """
+    Copia en memoria, compartida por todo el proceso, de las tablas que
+    definen qué se reproduce: sensor_videos, etiquetas_sensores,
+    background_videos y system_config. Son tablas de pocas filas que casi no
+    cambian, así que los endpoints públicos responden desde aquí sin ir a
+    SQLite en el camino crítico "levantar producto → reproducir video".
+
+    Quien escribe en esas tablas llama a `refresh(tabla, ...)` después del
+    commit; se recargan solo las tablas indicadas, `version` aumenta en uno
+    y se avisa a los suscriptores con `callback(tablas, version)`.
+
+    `etag` identifica la versión vigente; incluye la hora de arranque para
+    que un ETag emitido antes de reiniciar el proceso no coincida con una
+    versión nueva que casualmente tenga el mismo número.
+    """
+
+    def __init__(self, connection=database.connection):
+        self._connection = connection
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._boot_id = format(int(time.time() * 1000), 'x')
+        self._serialized = {}  # clave -> (version, JSON en bytes)
+        self._snapshot = CatalogSnapshot(MappingProxyType({}), MappingProxyType({}),
+                                         (), MappingProxyType({}), MappingProxyType({}), 0)
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def etag(self):
+        return f'{self._boot_id}-{self._snapshot.version}'
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def load(self):
+        """Carga todas las tablas (al iniciar el servidor)."""
+        return self.refresh(*TABLES)
+
+    def refresh(self, *tables):
+        unknown = set(tables) - set(_LOADERS)
+        if unknown:
+            raise ValueError(f"Tablas fuera del catálogo: {sorted(unknown)}")
+
+        with self._lock:
+            with self._connection() as conn:
+                c = conn.cursor()
+                changes = {}
+                for table in tables:
+                    field, loader = _LOADERS[table]
+                    changes[field] = loader(c)
+            snapshot = self._snapshot._replace(version=self._snapshot.version + 1, **changes)
+            self._snapshot = snapshot
+            self._serialized = {}
+
+        for callback in self._listeners:
+            callback(tables, snapshot.version)
+        return snapshot.version
+
+    def serialized(self, key, build):
+        """
+        JSON (bytes) de `build()` para la versión vigente. Se serializa una
+        vez por versión y clave; las peticiones siguientes reutilizan los bytes.
+        """
+        version = self._snapshot.version
+        cached = self._serialized.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        body = json.dumps(build()).encode('utf-8')
+        with self._lock:
+            if self._snapshot.version == version:
+                self._serialized[key] = (version, body)
+        return body
+
+    # Consultas sobre la fotografía vigente
+
+    def sensor_name(self, sensor_id, snapshot=None):
+        """nombre_fantasia o, si no tiene, sensor_numero (como COALESCE en SQL)."""
+        etiqueta = (snapshot or self._snapshot).etiquetas.get(sensor_id)
+        if etiqueta is None:
+            return None
+        return etiqueta['nombre_fantasia'] or etiqueta['sensor_numero']
+
+    def video_name(self, video_path, snapshot=None):
+        """Nombre con que se subió el archivo (o el nombre del archivo si no está registrado)."""
+        if not video_path:
+            return None
+        names = (snapshot or self._snapshot).media_names
+        return names.get(video_path) or video_path.split('/')[-1]
+
+    def sensor_video(self, sensor_id):
+        snapshot = self._snapshot
+        video_path = snapshot.sensor_videos.get(sensor_id)
+        if video_path is None:
+            return None
+        return {'video_path': video_path,
+                'video_name': self.video_name(video_path, snapshot),
+                'media_url': media.url_for_media(video_path),
+                'nombre': self.sensor_name(sensor_id, snapshot)}
+
+    def sensor_videos(self):
+        snapshot = self._snapshot
+        return [{'sensor_id': sensor_id,
+                 'video_path': video_path,
+                 'video_name': self.video_name(video_path, snapshot),
+                 'media_url': media.url_for_media(video_path),
+                 'nombre': self.sensor_name(sensor_id, snapshot)}
+                for sensor_id, video_path in snapshot.sensor_videos.items()]
+
+    def etiquetas(self):
+        return [{'gpio_pin': gpio_pin, **etiqueta}
+                for gpio_pin, etiqueta in self._snapshot.etiquetas.items()]
+
+    def background_videos(self):
+        snapshot = self._snapshot
+        return [dict(video,
+                     video_name=self.video_name(video['video_path'], snapshot),
+                     media_url=media.url_for_media(video['video_path']))
+                for video in snapshot.background_videos]
+
+    def config(self, key=None, default=None):
+        if key is None:
+            return dict(self._snapshot.system_config)
+        return self._snapshot.system_config.get(key, default)
@@ -1,12 +1,19 @@
+import hashlib
+import json
 import os
-import requests
+import re
+import threading
+from collections import defaultdict
 from urllib.parse import urljoin
 from credential_manager import credential_manager as credentials
+import database
+import media
+import media_registry
+from downloader import Downloader, DownloadError
 from datetime import datetime
 
 CMS_JSON_URL = "https://clientes.tecnoactive.cl/cms_content/json/json_contenidos.php?pantalla_id="
-base_folder = "cms"
-os.makedirs(base_folder, exist_ok=True)
+SHA256_PATTERN = re.compile(r'^[0-9a-fA-F]{64}$')
 
 # archivo .log para guardar los errores
 log_file = os.path.join(os.path.dirname(__file__), "cms_sync.log")
@@ -33,6 +40,11 @@ def log_data(message):
         print(message)
 
 
+# Sesión HTTP y pool de descargas compartidos por todas las pantallas
+downloader = Downloader(log=log_data)
+# Un mismo archivo puede aparecer en varias pantallas procesadas en paralelo
+_content_locks = defaultdict(threading.Lock)
+
 def get_gpio(sensor_value):
     sensors = [
         {"sensor": 1, "gpio": 17},
@@ -52,33 +64,28 @@ def get_gpio(sensor_value):
 
 def assign_cms_media(video_path: str, sensor_id: int):
     """
-    Uploads a video file to the given API endpoint.
+    Asigna un video ya almacenado (ver media_registry.store) al sensor o,
+    con sensor_id 0, a la playlist de fondo si todavía no está en ella.
 
-    :param video_path: The local path to the video file.
-    :param sensor_id: The sensor ID associated with the video.
-    :return: The JSON response from the server.
+    :param video_path: video_path relativo a static/ (videos/<sha256>.<ext>).
+    :param sensor_id: The sensor ID associated with the video (0 = fondo).
+    :return: dict con 'id' y 'new' (si hubo cambio), o 'error'.
     """
     log_data(f"assign_cms_media {video_path} {sensor_id}")
-    base_url = 'http://localhost:5000/api/'
-    #api_url = "upload_video" if '_' in video_path.split('/')[1] else "upload_background"
-    api_url = "upload_video" if sensor_id > 0 else "upload_background"
-    
     try:
-        with open(video_path, 'rb') as video_file:
-            files = {'video': video_file}
-            data = {'sensor_id': sensor_id}
-
-            print(f"** Sending file {video_path.split('/')[1]} for sensor {sensor_id} to {api_url}")
-            log_data(f"** Sending file {video_path.split('/')[1]} for sensor {sensor_id} to {api_url}")
-            response = requests.post(base_url + api_url, files=files, data=data)
-
-            response.raise_for_status()  # Raise an error for non-200 responses
-            print(response.json())
-            log_data(f"Response: {str(response.json())}")
-            return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"HTTP Request failed: {e}")
-        return {'error': f'HTTP request failed: {str(e)}'}
+        if sensor_id > 0:
+            new = media_registry.sensor_video_path(sensor_id) != video_path
+            if new:
+                media_registry.assign_sensor_video(sensor_id, video_path)
+            response = {'success': True, 'id': sensor_id, 'new': new}
+        else:
+            video_id = media_registry.background_video_id(video_path)
+            new = video_id is None
+            if new:
+                video_id = media_registry.add_background_video(video_path)
+            response = {'success': True, 'id': video_id, 'new': new}
+        log_data(f"Response: {str(response)}")
+        return response
     except Exception as e:
         print(f"Unexpected error: {e}")
         return {'error': f'Unexpected error: {str(e)}'}
@@ -89,130 +96,260 @@ def assign_label(sensor_id: int, label: str):
 
     :param sensor_id: The sensor ID to assign the label to.
     :param label: The label to assign to the sensor.
-    :return: The JSON response from the server.
+    :return: dict con 'success' o 'error'.
     """
     print('assign_label')
-    api_url = "http://localhost:5000/api/actualizar-etiqueta"  # Update with the correct endpoint
-    
     try:
-        headers = {'Content-Type': 'application/json'}
-        data = {'gpio_pin': sensor_id, 'nombre_fantasia': label}
-
-        response = requests.post(api_url, json=data, headers=headers)  # Use `json=data`
-
-        response.raise_for_status()  # Raise an error for non-200 responses
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"HTTP Request failed: {e}")
-        return {'error': f'HTTP request failed: {str(e)}'}
+        media_registry.set_sensor_label(sensor_id, label)
+        return {'success': True}
     except Exception as e:
         print(f"Unexpected error: {e}")
         return {'error': f'Unexpected error: {str(e)}'}
 
 def move_new_background(video_id, direction):
     """
-    Calls the /api/move_background endpoint to move a background video up or down.
+    Moves a background video up or down in the playlist.
     
     Parameters:
         video_id (int): The ID of the video to move.
         direction (str): The direction to move ('up' or 'down').
     
     Returns:
-        dict: The response from the API as a dictionary.
+        dict: 'success' o 'error'.
     """
-    API_URL = "http://localhost:5000/api/move_background"
-
-    payload = {
-        "video_id": video_id,
-        "direction": direction
-    }
     print('moving background')
     try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        media_registry.move_background_video(video_id, direction)
+        return {'success': True}
+    except Exception as e:
         return {"error": str(e)}
 
 def generate_sensors_id(base_string):
     return [base_string] + [f"{base_string}_{i}" for i in range(1, 11)]
 
-def download_file(url, dest_path):
-    """Descarga un archivo desde una URL y lo guarda en dest_path."""
+def download_file(url, dest_path, etag=None, sha256=None):
+    """
+    Descarga un archivo desde una URL y lo guarda en dest_path (vía .part,
+    con reanudación y reintentos; con `sha256` se verifica el archivo
+    completo). Devuelve un DownloadResult, o None si falló.
+    """
     try:
         print('download_file '+url+' '+dest_path)
         log_data(f"Descargando... {url} -> {dest_path}")
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        with open(dest_path, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        print(f"Descargado: {url} -> {dest_path}")
-        log_data(f"Descargado: {url} -> {dest_path}")
-    except Exception as e:
+        result = downloader.download(url, dest_path, etag, sha256)
+        if result.modified:
+            print(f"Descargado: {url} -> {dest_path}")
+            log_data(f"Descargado: {url} -> {dest_path}")
+        return result
+    except DownloadError as e:
         print(f"Error descargando {url}: {e}")
         log_data(f"Error descargando {url}: {e}")
+        return None
+
+def _expected_size(content):
+    """Tamaño informado por el CMS (size o peso) en bytes, o None si no es un entero."""
+    value = content.get("size") or content.get("peso")
+    if value is None:
+        return None
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        log_data(f"Tamaño inválido en el manifiesto, se ignora: {value!r}")
+        return None
+    return size if size > 0 else None
+
+def _expected_sha256(content):
+    """sha256 informado por el CMS, solo si viene en un campo que lo nombra."""
+    value = content.get("sha256")
+    if value is None:
+        return None
+    if not isinstance(value, str) or not SHA256_PATTERN.match(value):
+        log_data(f"sha256 inválido en el manifiesto, se ignora: {value!r}")
+        return None
+    return value.lower()
+
+def fetch_content(content, content_url):
+    """
+    Obtiene un item del manifiesto en el almacén por contenido. Si el CMS
+    informa sha256 y ya está almacenado, no se descarga; si no, se pide
+    condicionalmente con el ETag de la descarga anterior del mismo nombre.
+    Lo descargado se verifica contra size/sha256/md5 del CMS cuando vienen.
+    Devuelve el video_path almacenado, o None si falló.
+    """
+    # El lock y el temporal usan la misma clave: dos URLs con el mismo
+    # nombre de archivo no comparten temporal
+    url_key = hashlib.sha256(content_url.encode('utf-8')).hexdigest()[:16]
+    with _content_locks[url_key]:
+        return _fetch_content(content, content_url, url_key)
+
+def _fetch_content(content, content_url, url_key):
+    name = os.path.basename(content["url"])
+    expected_sha256 = _expected_sha256(content)
+    expected_md5 = content.get("md5")
+    expected_size = _expected_size(content)
+
+    if expected_sha256:
+        stored_path = media_registry.find_by_sha256(expected_sha256)
+        if stored_path and media_registry.link(name, stored_path, expected_sha256,
+                                               expected_size, content_url):
+            return stored_path
+
+    known = media_registry.lookup(name)
+    if known and not os.path.exists(media.media_path(known['video_path'])):
+        known = None
+    etag = known['etag'] if known and known['source_url'] == content_url else None
+
+    dest_path = os.path.join(media_registry.VIDEOS_FOLDER, f".{url_key}.{name}.cms")
+    result = download_file(content_url, dest_path, etag, expected_sha256)
+    if result is None:
+        return None
+    if not result.modified:
+        if media_registry.link(name, known['video_path'], known['sha256'], known['size'],
+                               known['source_url'], known['etag']):
+            return known['video_path']
+        # El GC se lo llevó después del 304: se descarga sin condición
+        result = download_file(content_url, dest_path, None, expected_sha256)
+        if result is None:
+            return None
+
+    try:
+        sha256 = media_registry.verify(dest_path, expected_size, expected_sha256, expected_md5)
+    except media_registry.VerificationError as e:
+        log_data(f"Descarga descartada: {e}")
+        print(f"Descarga descartada: {e}")
+        os.remove(dest_path)
+        return None
+    return media_registry.store(dest_path, name, sha256, content_url, result.etag)
+
+def get_manifest_state(pantalla_id):
+    """(etag, last_modified, content_hash) del último manifiesto procesado."""
+    with database.connection() as conn:
+        row = conn.execute('''
+            SELECT etag, last_modified, content_hash
+            FROM cms_manifests WHERE pantalla_id = ?
+        ''', (pantalla_id,)).fetchone()
+    return row or (None, None, None)
+
+def save_manifest_state(pantalla_id, etag, last_modified, content_hash, changed,
+                        video_paths=None):
+    """
+    Guarda los validadores del manifiesto. `video_paths` (los videos que
+    referencia) solo se reemplaza cuando se procesó un manifiesto nuevo.
+    Quien llama no lo hace si nada cambió: checked_at es la última vez que
+    cambiaron los validadores, no la última consulta.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    paths_json = json.dumps(video_paths) if video_paths is not None else None
+    with database.connection() as conn:
+        conn.execute('''
+            INSERT INTO cms_manifests
+            (pantalla_id, etag, last_modified, content_hash, checked_at, changed_at, video_paths)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(pantalla_id) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                content_hash = excluded.content_hash,
+                checked_at = excluded.checked_at,
+                changed_at = COALESCE(excluded.changed_at, cms_manifests.changed_at),
+                video_paths = COALESCE(excluded.video_paths, cms_manifests.video_paths)
+        ''', (pantalla_id, etag, last_modified, content_hash, now, now if changed else None,
+              paths_json))
 
 def process_url(url):
     """
-    Procesa una URL de un JSON de contenido desde el CMS de TecnoActive
+    Procesa una URL de un JSON de contenido desde el CMS de TecnoActive.
+
+    El manifiesto se pide con If-None-Match / If-Modified-Since; si el CMS
+    responde 304, o el contenido tiene el mismo hash que el último
+    procesado, no se hace nada más. Devuelve True si la playlist cambió.
     """
     try:
         pantalla_id = url.split("=")[-1]
-        pantalla_folder = os.path.join(base_folder, pantalla_id)
-        os.makedirs(pantalla_folder, exist_ok=True)
+        etag, last_modified, content_hash = get_manifest_state(pantalla_id)
 
-        response = requests.get(url)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = downloader.get(url, headers=headers)
+        if response.status_code == 304:
+            return False
         response.raise_for_status()
+
+        new_hash = hashlib.sha256(response.content).hexdigest()
+        new_etag = response.headers.get('ETag')
+        new_last_modified = response.headers.get('Last-Modified')
+        if new_hash == content_hash:
+            # Mismo contenido; solo se escribe si el CMS cambió los validadores
+            # (sin esto cada vuelta reescribía las 11 pantallas)
+            if (new_etag, new_last_modified) != (etag, last_modified):
+                save_manifest_state(pantalla_id, new_etag, new_last_modified, new_hash, False)
+            return False
+
         data = response.json()
 
         log_data(f"Procesando {url}")
         log_data(f"Contenido: {data}")
 
         expected_files = []
+        complete = True
         playlist = data.get("Playlist", [])
         playlist_name = playlist[0]['descripcion']
+        sensor_number = int(pantalla_id.split('_')[-1]) if '_' in pantalla_id else 0
         for item in playlist:
             items = item.get("Item", [])
             for content in items:
-                content_url = urljoin("https://clientes.tecnoactive.cl/cms_content/", content["url"])
-                #dest_path = os.path.join(pantalla_folder, os.path.basename(content["url"]))
-                dest_path = os.path.join("static/videos", os.path.basename(content["url"]))
-                print(f"** {content_url} -> {dest_path}")
-                log_data(f"** {content_url} -> {dest_path}")
-                expected_files.append(dest_path)
-                if not os.path.exists(dest_path):
-                    download_file(content_url, dest_path)
-                    sensor_number = int(pantalla_id.split('_')[-1]) if '_' in pantalla_id else 0
-                    resp = assign_cms_media(dest_path, get_gpio(sensor_number))
+                # Un item mal formado o que falla no detiene al resto; el
+                # manifiesto queda incompleto y se reprocesa la próxima vuelta
+                try:
+                    content_url = urljoin("https://clientes.tecnoactive.cl/cms_content/", content["url"])
+                    print(f"** {content_url}")
+                    log_data(f"** {content_url}")
+                    video_path = fetch_content(content, content_url)
+                    if video_path is None:
+                        complete = False
+                        continue
+                    expected_files.append(video_path)
+                    resp = assign_cms_media(video_path, get_gpio(sensor_number))
                     if sensor_number == 0: # es un background o un video ?
-                        log_data(f"Background ID: {resp['id']}")
-                        move_new_background(resp["id"], "up")
+                        log_data(f"Background ID: {resp.get('id')}")
+                        if resp.get('new'):
+                            move_new_background(resp["id"], "up")
                     else:
-                        log_data(f"Video ID: {resp['id']}")
+                        log_data(f"Video ID: {resp.get('id')}")
                         assign_label(get_gpio(sensor_number), playlist_name)
+                except Exception as e:
+                    complete = False
+                    log_data(f"Error procesando item {content!r} de {url}: {e}")
+                    print(f"Error procesando item de {url}: {e}")
 
-        existing_files = [os.path.join(pantalla_folder, f) for f in os.listdir(pantalla_folder)]
-        for file in existing_files:
-            if file not in expected_files:
-                os.remove(file)
-                print(f"Eliminado archivo no esperado: {file}")
+        # Solo se recuerda el manifiesto si todas sus descargas terminaron;
+        # si alguna falló, la próxima vuelta lo vuelve a procesar. Los videos
+        # que deja de referenciar los elimina media_gc.py.
+        if complete:
+            save_manifest_state(pantalla_id, new_etag, new_last_modified, new_hash, True,
+                                expected_files)
+        return True
 
     except Exception as e:
         log_data(f"Error procesando {url}: {e}")
         print(f"Error procesando {url}: {e}")
+        return False
 
 def get_media():
+    """Sincroniza todas las pantallas; devuelve True si alguna playlist cambió."""
     print('** get media')
-    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_data(f"\n********* get media ({fecha}) *********")
     CREDENTIALS = credentials.get_credentials()
-    log_data(f"Credentials: {str(CREDENTIALS)}")
     sensors_ids = generate_sensors_id(CREDENTIALS['device_id'])
-    for sensor_id in sensors_ids:
-        url = CMS_JSON_URL + sensor_id
-        print('** get media '+url)
-        process_url(url)
+    urls = [CMS_JSON_URL + sensor_id for sensor_id in sensors_ids]
+    # Las pantallas se procesan en paralelo, con DOWNLOAD_WORKERS descargas a la vez
+    changed = [url for url, result in zip(urls, downloader.map(process_url, urls)) if result]
+    if changed:
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_data(f"\n********* get media ({fecha}): {len(changed)} playlists cambiaron *********")
+        log_data(f"Credentials: {str(CREDENTIALS)}")
+    return bool(changed)
 
 if __name__ == "__main__":
     # Ejecutar la función principal
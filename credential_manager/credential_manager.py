@@ -1,20 +1,37 @@
 from .get_mac_address import get_mac_address as get_mac
-from .request_device_id import request_device_id as request_id
+from .request_device_id import request_device_id as request_id, REQUEST_TIMEOUT
 import json
 import os
 import http.client
+import threading
+import time
 import urllib.parse
-import json
+
+CREDENTIALS_FILE = '/home/pi/vitrina/credentials.json'
+VALIDATE_URL = "https://clientes.tecnoactive.cl/liftandlearn2/api.php?action=validate_device_id&device_id="
+REVALIDATE_INTERVAL = 6 * 3600  # segundos entre validaciones del device_id con el servidor
+REVALIDATE_RETRY = 5 * 60  # si el servidor no respondió, se reintenta antes
+
+# Credenciales en memoria. get_credentials las devuelve sin tocar la red ni
+# el archivo; la validación del device_id corre en un hilo aparte cada
+# REVALIDATE_INTERVAL, y mientras tanto (o sin conexión) se usa el último id
+# válido conocido.
+_cache = None
+_next_validation = 0.0  # time.monotonic() de la próxima validación
+_refresh_thread = None
+# Sube con cada clear_credentials: una revalidación lanzada antes no debe
+# volver a poner en memoria las credenciales recién borradas
+_generation = 0
+_lock = threading.Lock()
 
 def validate_device_id(device_id):
-    url = "https://clientes.tecnoactive.cl/liftandlearn2/api.php?action=validate_device_id&device_id=" + device_id
-    parsed_url = urllib.parse.urlsplit(url)
-    conn = http.client.HTTPConnection(parsed_url.netloc)
-    
+    parsed_url = urllib.parse.urlsplit(VALIDATE_URL + urllib.parse.quote(device_id))
+    conn = http.client.HTTPSConnection(parsed_url.netloc, timeout=REQUEST_TIMEOUT)
+
     try:
         conn.request("GET", parsed_url.path + "?" + parsed_url.query)
         response = conn.getresponse()
-        
+
         if response.status == 200:
             data = response.read()
             return json.loads(data)
@@ -33,32 +50,118 @@ def create_credentials():
         "device_id": request_id(mac)
     }
 
-def get_credentials():
-    filename = '/home/pi/vitrina/credentials.json'
+def _read_file():
+    if not os.path.exists(CREDENTIALS_FILE) or os.stat(CREDENTIALS_FILE).st_size == 0:
+        return None
+    with open(CREDENTIALS_FILE, 'r') as file:
+        return json.load(file)
 
-    if not os.path.exists(filename) or os.stat(filename).st_size == 0:
-        estructura_inicial = create_credentials()
-        with open(filename, 'w') as file:
-            json.dump(estructura_inicial, file)
-        os.chmod(filename, 0o777)  # 🔹 Establecer permisos 777
-        return estructura_inicial
+def _write_file(data):
+    tmp_path = CREDENTIALS_FILE + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file)
+    os.chmod(tmp_path, 0o777)  # 🔹 Establecer permisos 777
+    os.replace(tmp_path, CREDENTIALS_FILE)
 
-    with open(filename, 'r') as file:
-        data = json.load(file)
+def _load():
+    """Credenciales del archivo, completando lo que falte (sin validar el id)."""
+    data = _read_file()
+    if data is None:
+        data = create_credentials()
+        _write_file(data)
+        return data
 
+    changed = False
     if "device_mac" not in data or not data["device_mac"]:
         data["device_mac"] = get_mac()
-    if "device_id" not in data or not data["device_id"] or not validate_device_id(data["device_id"]):
+        changed = True
+    if "device_id" not in data or not data["device_id"]:
         data["device_id"] = request_id(data["device_mac"])
+        changed = True
+    if changed:
+        _write_file(data)
+    return data
 
-    with open(filename, 'w') as file:
-        json.dump(data, file)
+def _revalidate(data, generation):
+    """
+    Valida el device_id con el servidor. Solo se pide uno nuevo si el
+    servidor responde que no es válido; un error de red o una respuesta
+    inesperada conservan el id actual. Si entretanto se llamó a
+    clear_credentials (`generation` cambió), el resultado se descarta.
+    """
+    global _cache, _next_validation
+
+    def retry_later():
+        global _next_validation
+        with _lock:
+            if _generation == generation:
+                _next_validation = time.monotonic() + REVALIDATE_RETRY
 
-    os.chmod(filename, 0o777)  # 🔹 Establecer permisos 777 después de modificar
+    try:
+        valid = validate_device_id(data["device_id"])
+    except Exception as e:
+        print(f"No se pudo validar el device_id, se usa el último conocido: {e}")
+        retry_later()
+        return
+
+    renewed = False
+    if not valid:
+        try:
+            data = dict(data, device_id=request_id(data["device_mac"]))
+            renewed = True
+        except Exception as e:
+            print(f"No se pudo renovar el device_id: {e}")
+            retry_later()
+            return
+
+    # La red se consulta sin el lock; el resultado se publica solo si nadie
+    # borró las credenciales mientras tanto
+    with _lock:
+        if _generation != generation:
+            return
+        if renewed:
+            try:
+                _write_file(data)
+            except OSError as e:
+                print(f"No se pudo guardar el device_id renovado: {e}")
+            print(f"device_id renovado: {data['device_id']}")
+        _cache = data
+        _next_validation = time.monotonic() + REVALIDATE_INTERVAL
+
+def refresh():
+    """Lanza la validación en segundo plano si no hay una en curso."""
+    global _refresh_thread
+    with _lock:
+        if _cache is None or (_refresh_thread is not None and _refresh_thread.is_alive()):
+            return
+        _refresh_thread = threading.Thread(target=_revalidate, args=(dict(_cache), _generation),
+                                           name='credentials-refresh', daemon=True)
+        _refresh_thread.start()
+
+def get_credentials():
+    """
+    Credenciales del dispositivo ({device_mac, device_id}) desde memoria.
+    Solo la primera llamada del proceso lee el archivo (y, si no existe,
+    registra el dispositivo). Si pasó REVALIDATE_INTERVAL se revalida en
+    segundo plano sin bloquear a quien llama.
+    """
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = _load()
+        data = dict(_cache)
+        due = time.monotonic() >= _next_validation
+    if due:
+        refresh()
     return data
 
 def clear_credentials():
-    filename = '/home/pi/vitrina/credentials.json'
+    global _cache, _next_validation, _generation
+    with _lock:
+        _generation += 1
+        _cache = None
+        _next_validation = 0.0
+    filename = CREDENTIALS_FILE
     if os.path.exists(filename):
         try:
             os.remove(filename)
@@ -71,4 +174,3 @@ def clear_credentials():
 
 if __name__ == '__main__':
     print(get_credentials())
-
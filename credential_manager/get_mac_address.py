@@ -1,28 +1,35 @@
-import re
-import subprocess
+import functools
+import os
 
-def get_mac_address():
-    try:
-        # Ejecutar ifconfig y capturar la salida
-        result = subprocess.run(['/usr/sbin/ifconfig'], capture_output=True, text=True)
-        output = result.stdout
-
-        # Buscar la sección de wlan0
-        match = re.search(r'wlan0:.*?ether ([0-9a-fA-F:]{17})', output, re.DOTALL)
-        if match:
-            return match.group(1)  # Retorna la MAC de wlan0
+SYS_CLASS_NET = '/sys/class/net'
+# Interfaces que se prueban en orden. La MAC identifica al dispositivo ante el
+# servidor: solo wlan0, como antes. Con eth0 de respaldo, un arranque en que
+# wlan0 aún no aparece registraría (y recordaría) otra identidad.
+INTERFACES = ('wlan0',)
+EMPTY_MAC = '00:00:00:00:00:00'
 
-        # Si no se encuentra en ifconfig, probar con 'ip link'
-        result = subprocess.run(['/usr/sbin/ip', '/usr/bin/link'], capture_output=True, text=True)
-        output = result.stdout
-        match = re.search(r'wlan0.*?link/ether ([0-9a-fA-F:]{17})', output)
-        if match:
-            return match.group(1)  # Retorna la MAC de wlan0
-
-        raise RuntimeError("No se pudo encontrar la dirección MAC de wlan0.")
+def read_mac_address(interface):
+    """MAC de `interface` leída de sysfs, o None si no existe o está vacía."""
+    try:
+        with open(os.path.join(SYS_CLASS_NET, interface, 'address')) as f:
+            mac = f.read().strip().lower()
+    except OSError:
+        return None
+    return mac if mac and mac != EMPTY_MAC else None
 
-    except Exception as e:
-        raise RuntimeError("Error al obtener la dirección MAC.") from e
+@functools.lru_cache(maxsize=None)
+def get_mac_address(interfaces=INTERFACES):
+    """
+    MAC de la primera interfaz de `interfaces` que la tenga. Lee
+    /sys/class/net directamente (sin lanzar ifconfig/ip) y se calcula una
+    sola vez por proceso; si no la encuentra lanza RuntimeError y la próxima
+    llamada vuelve a intentar.
+    """
+    for interface in interfaces:
+        mac = read_mac_address(interface)
+        if mac:
+            return mac
+    raise RuntimeError(f"No se pudo encontrar la dirección MAC de {', '.join(interfaces)}.")
 
-# Prueba la función
-print(get_mac_address())
+if __name__ == '__main__':
+    print(get_mac_address())
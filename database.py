@@ -0,0 +1,316 @@
+import queue
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytz
+
+DB_PATH = '/home/pi/vitrina/vitrina.db'
+TIMEZONE = pytz.timezone('America/Santiago')
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Ajustes de SQLite para la Raspberry Pi (SD lenta, poca RAM)
+POOL_SIZE = 4  # conexiones ociosas que se conservan abiertas
+BUSY_TIMEOUT = 5.0  # segundos de espera si otra conexión tiene el lock de escritura
+CACHE_SIZE_KIB = 8 * 1024  # caché de páginas por conexión
+MMAP_SIZE = 64 * 1024 * 1024  # lectura mapeada en memoria
+
+
+def connect(path=DB_PATH):
+    """
+    Abre una conexión configurada: WAL para que las lecturas del dashboard
+    no bloqueen las escrituras de activaciones, synchronous=NORMAL (en WAL
+    no arriesga la base, solo la última transacción ante un corte), caché
+    de páginas y mmap dimensionados.
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones compartido por todos los hilos del proceso.
+
+    Conserva hasta `size` conexiones abiertas; si todas están en uso se abre
+    una extra que se cierra al devolverla, de modo que una exportación larga
+    nunca deja esperando al resto de las peticiones.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+            return
+        conn.close()
+
+    @contextmanager
+    def connection(self, row_factory=None):
+        """
+        Presta una conexión dentro de una transacción: commit al salir del
+        bloque, rollback si hubo excepción (igual que `with sqlite3.connect`).
+        """
+        conn = self.acquire()
+        try:
+            conn.row_factory = row_factory
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+pool = ConnectionPool()
+
+
+def connection(row_factory=None):
+    return pool.connection(row_factory)
+
+
+def day_bounds(day):
+    """[inicio, fin) de un día (date) como texto comparable con timestamp."""
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1)
+    return start.strftime(DATETIME_FORMAT), end.strftime(DATETIME_FORMAT)
+
+
+def period_bounds(period, now=None):
+    """
+    Límites [inicio, fin) de 'today', 'yesterday', 'week' (hoy y los 6 días
+    anteriores) o 'month' (mes calendario en curso) en hora de Santiago.
+
+    Los timestamps se guardan como texto en hora local, así que comparar
+    `timestamp >= ? AND timestamp < ?` contra estos valores usa los índices,
+    a diferencia de `date(timestamp) = date('now')` (que además usa UTC).
+    """
+    today = (now or datetime.now(TIMEZONE)).date()
+    if period == 'today':
+        return day_bounds(today)
+    if period == 'yesterday':
+        return day_bounds(today - timedelta(days=1))
+    if period == 'week':
+        return day_bounds(today - timedelta(days=6))[0], day_bounds(today)[1]
+    if period == 'month':
+        start = today.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return day_bounds(start)[0], day_bounds(next_month)[0]
+    raise ValueError(f"Período desconocido: {period}")
+
+
+def _rebuild_rollups(c):
+    import rollups  # import diferido: rollups importa este módulo
+    rollups.rebuild(c)
+
+
+def _add_column(table, column, definition):
+    """
+    Paso de migración que agrega una columna solo si falta, para que una
+    base que quedó a medio migrar (con la columna ya creada) pueda terminar.
+    """
+    def step(c):
+        columns = [row[1] for row in c.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return step
+
+
+# Migraciones de esquema, aplicadas en orden según PRAGMA user_version.
+# Cada paso es SQL o una función que recibe el cursor. Nunca modificar una
+# migración ya publicada: agregar una nueva al final.
+MIGRATIONS = [
+    # 1: índices para filtros por rango de fecha y por sensor en activaciones
+    [
+        'CREATE INDEX IF NOT EXISTS idx_activaciones_timestamp '
+        'ON activaciones (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_activaciones_sensor_open '
+        'ON activaciones (sensor_id, completed, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_activaciones_completed_ts '
+        'ON activaciones (completed, timestamp)',
+    ],
+    # 2: resúmenes incrementales por hora y por día (ver rollups.py)
+    [
+        _add_column('sensor_stats_hourly', 'completed_activations', 'INTEGER DEFAULT 0'),
+        _add_column('sensor_stats_hourly', 'total_duration', 'INTEGER DEFAULT 0'),
+        '''CREATE TABLE IF NOT EXISTS sensor_stats_daily (
+            sensor_id INTEGER,
+            date DATE,
+            total_activations INTEGER DEFAULT 0,
+            completed_activations INTEGER DEFAULT 0,
+            total_duration INTEGER DEFAULT 0,
+            PRIMARY KEY (sensor_id, date)
+        )''',
+        _rebuild_rollups,
+    ],
+    # 3: validadores de los manifiestos del CMS para pedirlos condicionalmente
+    [
+        '''CREATE TABLE IF NOT EXISTS cms_manifests (
+            pantalla_id TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            checked_at TIMESTAMP,
+            changed_at TIMESTAMP
+        )''',
+    ],
+    # 4: almacén direccionado por contenido (ver media_registry.py)
+    [
+        '''CREATE TABLE IF NOT EXISTS media_files (
+            name TEXT PRIMARY KEY,
+            video_path TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            size INTEGER,
+            source_url TEXT,
+            etag TEXT,
+            updated_at TIMESTAMP
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_media_files_sha256 ON media_files (sha256)',
+    ],
+    # 5: videos de cada manifiesto del CMS (JSON), referencias vivas para media_gc.py
+    [
+        _add_column('cms_manifests', 'video_paths', 'TEXT'),
+    ],
+    # 6: outbox de activaciones completadas para el reporte (ver report_outbox.py)
+    [
+        '''CREATE TABLE IF NOT EXISTS report_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            activation_id INTEGER NOT NULL UNIQUE,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS report_cursor (
+            name TEXT PRIMARY KEY,
+            last_outbox_id INTEGER NOT NULL,
+            updated_at TIMESTAMP
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_activaciones_outbox_insert
+            AFTER INSERT ON activaciones WHEN NEW.completed = 1
+        BEGIN
+            INSERT OR IGNORE INTO report_outbox (activation_id, idempotency_key, created_at)
+            VALUES (NEW.id, lower(hex(randomblob(16))), datetime('now', 'localtime'));
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_activaciones_outbox_complete
+            AFTER UPDATE OF completed ON activaciones
+            WHEN NEW.completed = 1 AND OLD.completed IS NOT 1
+        BEGIN
+            INSERT OR IGNORE INTO report_outbox (activation_id, idempotency_key, created_at)
+            VALUES (NEW.id, lower(hex(randomblob(16))), datetime('now', 'localtime'));
+        END''',
+        # Lo que el reporte anterior aún iba a enviar (su ventana de 12
+        # minutos): sin esto, lo completado justo antes de actualizar no se
+        # reporta nunca. Lo más antiguo ya lo envió (o perdió) el reporte viejo.
+        '''INSERT OR IGNORE INTO report_outbox (activation_id, idempotency_key, created_at)
+            SELECT id, lower(hex(randomblob(16))), datetime('now', 'localtime')
+            FROM activaciones
+            WHERE completed = 1 AND timestamp >= datetime('now', '-12 minute', 'localtime')
+            ORDER BY timestamp, id''',
+    ],
+]
+
+# Consultas críticas y el índice que deben usar, verificadas con
+# EXPLAIN QUERY PLAN después de migrar.
+HOT_QUERIES = {
+    'rango_fechas': (
+        'idx_activaciones_timestamp',
+        'SELECT COUNT(*) FROM activaciones WHERE timestamp >= ? AND timestamp < ?',
+        ('2000-01-01', '2000-01-02'),
+    ),
+    'activacion_abierta': (
+        'idx_activaciones_sensor_open',
+        'SELECT id, start_time FROM activaciones '
+        'WHERE sensor_id = ? AND completed = 0 ORDER BY timestamp DESC LIMIT 1',
+        (17,),
+    ),
+    'completadas_recientes': (
+        'idx_activaciones_completed_ts',
+        'SELECT * FROM activaciones WHERE completed = 1 AND timestamp >= ?',
+        ('2000-01-01',),
+    ),
+}
+
+
+def migrate(conn):
+    """
+    Aplica las migraciones pendientes; devuelve la versión final.
+
+    Cada migración corre en su propia transacción BEGIN IMMEDIATE ... COMMIT
+    junto con el cambio de user_version. El módulo sqlite3 no abre
+    transacción antes de un ALTER/CREATE, así que con `with conn:` cada DDL
+    se confirmaba solo y un fallo a mitad dejaba la base a medio migrar.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # transacciones explícitas
+    try:
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            try:
+                for statement in statements:
+                    if callable(statement):
+                        statement(c)
+                    else:
+                        c.execute(statement)
+                c.execute(f'PRAGMA user_version = {number}')
+                c.execute('COMMIT')
+            except BaseException:
+                c.execute('ROLLBACK')
+                raise
+            print(f"Migración de base de datos {number} aplicada")
+    finally:
+        conn.isolation_level = isolation_level
+    if version < len(MIGRATIONS):
+        # Estadísticas frescas para que el planificador elija los índices nuevos
+        conn.execute('ANALYZE activaciones')
+    return len(MIGRATIONS)
+
+
+def check_query_plans(conn, logger=None):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre HOT_QUERIES y avisa de las que no usan
+    su índice. Devuelve {nombre: (usa_indice, [detalle del plan])}.
+    """
+    report = {}
+    for name, (index, sql, params) in HOT_QUERIES.items():
+        plan = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        uses_index = any(index in detail for detail in plan)
+        report[name] = (uses_index, plan)
+        if not uses_index:
+            message = f"Consulta '{name}' no usa {index}: {'; '.join(plan)}"
+            if logger:
+                logger.warning(message)
+            else:
+                print(message)
+    return report
+
+
+if __name__ == '__main__':
+    with connection() as conn:
+        print(f"Versión de esquema: {migrate(conn)}")
+        for name, (uses_index, plan) in check_query_plans(conn).items():
+            print(f"{'OK ' if uses_index else 'MAL'} {name}: {'; '.join(plan)}")
@@ -0,0 +1,203 @@
+"""
+Motor de descargas para la sincronización con el CMS.
+
+- Una sola `requests.Session` con pool de conexiones (keep-alive al CMS).
+- Cada descarga escribe en `<destino>.part` y solo al terminar se renombra
+  al destino con os.replace: nunca queda un video truncado con el nombre
+  final que el kiosko pueda intentar reproducir.
+- Si la conexión se corta, el reintento continúa desde el tamaño del .part
+  con `Range: bytes=N-` en vez de empezar de cero. Junto al .part se guarda
+  el ETag (o Last-Modified) de la respuesta que lo escribió y se envía como
+  `If-Range`: si el remoto cambió, el servidor manda el archivo completo en
+  vez de un trozo de otra versión. Un .part sin validador no se reanuda.
+- Con el `etag` de una descarga anterior, la petición es condicional: un 304
+  no descarga nada.
+- Si se conoce el sha256 se verifica el archivo completo; si no coincide se
+  descarta el .part y el reintento empieza de cero.
+- `map` reparte trabajos en un pool de hilos acotado.
+"""
+import hashlib
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DOWNLOAD_WORKERS = 3  # descargas simultáneas
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DOWNLOAD_TIMEOUT = (10, 60)  # (conexión, lectura entre bytes) en segundos
+DOWNLOAD_RETRIES = 4
+DOWNLOAD_RETRY_DELAY = 5  # segundos; se duplica en cada reintento
+PART_SUFFIX = '.part'
+VALIDATOR_SUFFIX = '.validator'  # junto al .part: ETag/Last-Modified para If-Range
+
+# path: destino (None si no cambió), etag: ETag de la respuesta, modified: False si 304
+DownloadResult = namedtuple('DownloadResult', ['path', 'etag', 'modified'])
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Downloader:
+    def __init__(self, workers=DOWNLOAD_WORKERS, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 timeout=DOWNLOAD_TIMEOUT, retries=DOWNLOAD_RETRIES, log=print):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.retries = retries
+        self.log = log
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, **kwargs):
+        """GET con la sesión compartida y el timeout por defecto."""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def download(self, url, dest_path, etag=None, sha256=None):
+        """
+        Descarga `url` en `dest_path` reanudando lo que haya en el .part.
+        Con `sha256` se verifica el archivo completo antes de renombrarlo.
+        Devuelve un DownloadResult; lanza DownloadError si se agotan los
+        reintentos.
+        """
+        part_path = dest_path + PART_SUFFIX
+        delay = DOWNLOAD_RETRY_DELAY
+        for attempt in range(1, self.retries + 1):
+            try:
+                modified, response_etag = self._fetch(url, part_path, etag)
+                if not modified:
+                    return DownloadResult(None, etag, False)
+                if sha256:
+                    self._check_sha256(part_path, sha256)
+                os.replace(part_path, dest_path)
+                self._discard_validator(part_path)
+                return DownloadResult(dest_path, response_etag, True)
+            except (requests.RequestException, OSError, DownloadError) as e:
+                self.log(f"Descarga de {url} falló (intento {attempt}/{self.retries}): {e}")
+                if attempt == self.retries:
+                    raise DownloadError(f"No se pudo descargar {url}: {e}") from e
+                time.sleep(delay)
+                delay *= 2
+
+    def _fetch(self, url, part_path, etag=None):
+        """Devuelve (modificado, etag de la respuesta)."""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = self._read_validator(part_path) if offset else None
+        if offset and not validator:
+            # Sin validador no hay forma de saber si el .part es de la
+            # versión actual: unir trozos de dos versiones corrompe el video
+            self.log(f"El .part de {url} no tiene validador, se descarga de nuevo")
+            os.remove(part_path)
+            offset = 0
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        elif etag:
+            headers['If-None-Match'] = etag
+
+        with self.get(url, stream=True, headers=headers) as response:
+            response_etag = response.headers.get('ETag')
+            if response.status_code == 304:
+                return False, etag
+            if response.status_code == 416 and offset:
+                # El .part sería el archivo completo solo si mide lo mismo
+                # que el remoto; si es de otra versión se empieza de cero
+                if self._remote_size(url, response) == offset:
+                    return True, response_etag
+                self.log(f"El .part de {url} no coincide con el remoto, se descarga de nuevo")
+                os.remove(part_path)
+                self._discard_validator(part_path)
+                return self._fetch(url, part_path, etag)
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                mode = 'ab'
+                expected = offset + int(response.headers.get('Content-Length', 0))
+            else:
+                # Archivo completo (sin .part, remoto distinto o el servidor
+                # ignoró el Range): se empieza de cero con su validador
+                mode = 'wb'
+                offset = 0
+                expected = int(response.headers.get('Content-Length', 0))
+                self._write_validator(part_path, response)
+
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+
+        size = os.path.getsize(part_path)
+        if expected and size != expected:
+            raise DownloadError(f"tamaño {size} distinto del esperado {expected}")
+        if offset:
+            self.log(f"Descarga reanudada desde el byte {offset}: {url}")
+        return True, response_etag
+
+    @staticmethod
+    def _check_sha256(part_path, sha256):
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        if digest.hexdigest() != sha256.lower():
+            # Un .part corrupto no se reanuda: el reintento parte de cero
+            os.remove(part_path)
+            Downloader._discard_validator(part_path)
+            raise DownloadError(f"sha256 {digest.hexdigest()} distinto del esperado {sha256}")
+
+    @staticmethod
+    def _write_validator(part_path, response):
+        """
+        Guarda el validador de `response` para reanudar con If-Range. If-Range
+        no admite ETags débiles (W/...); en ese caso se usa Last-Modified.
+        """
+        etag = response.headers.get('ETag')
+        validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+        if validator:
+            with open(part_path + VALIDATOR_SUFFIX, 'w') as f:
+                f.write(validator)
+        else:
+            Downloader._discard_validator(part_path)
+
+    @staticmethod
+    def _read_validator(part_path):
+        try:
+            with open(part_path + VALIDATOR_SUFFIX) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    @staticmethod
+    def _discard_validator(part_path):
+        try:
+            os.remove(part_path + VALIDATOR_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+    def _remote_size(self, url, response):
+        """Tamaño del remoto según `Content-Range: bytes */N` del 416 o un HEAD."""
+        content_range = response.headers.get('Content-Range', '')
+        if content_range.startswith('bytes */'):
+            try:
+                return int(content_range[len('bytes */'):])
+            except ValueError:
+                pass
+        try:
+            head = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            if head.ok and head.headers.get('Content-Length'):
+                return int(head.headers['Content-Length'])
+        except (requests.RequestException, ValueError) as e:
+            self.log(f"HEAD de {url} falló: {e}")
+        return None
+
+    def map(self, func, items):
+        """Aplica `func` a cada item con hasta `workers` hilos; devuelve los resultados."""
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='download') as executor:
+            return list(executor.map(func, items))
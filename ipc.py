@@ -0,0 +1,80 @@
+"""
+Canal local entre el proceso de tareas (`vitrina jobs`) y el servidor web.
+
+El servidor escucha en un socket Unix; el proceso de tareas envía mensajes
+cortos (dicts con 'type') para avisar que cambió el catálogo o para informar
+el estado de cada tarea. Si el servidor no está corriendo, `notify` devuelve
+False y el mensaje se descarta: el catálogo se recarga completo al arrancar.
+
+Los mensajes viajan como líneas JSON (nunca pickle: el servicio corre como
+root y deserializar pickle de un tercero ejecuta código) y el socket queda
+con permisos 0600, solo accesible para el mismo usuario.
+"""
+import json
+import os
+import socket
+import threading
+
+IPC_ADDRESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vitrina.sock')
+IPC_SOCKET_MODE = 0o600
+IPC_TIMEOUT = 5  # segundos; un cliente colgado no bloquea al servidor ni al que avisa
+IPC_MAX_MESSAGE = 64 * 1024  # bytes por línea
+
+
+class EventListener(threading.Thread):
+    """Recibe mensajes y llama a `handler(message)` desde este hilo."""
+
+    def __init__(self, handler, address=IPC_ADDRESS, logger=None):
+        super().__init__(name='ipc-listener', daemon=True)
+        self.handler = handler
+        self.address = address
+        self.logger = logger
+        # Socket de una ejecución anterior que no se cerró limpiamente
+        if os.path.exists(address):
+            os.remove(address)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(address)
+        os.chmod(address, IPC_SOCKET_MODE)
+        self._sock.listen()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break  # listener cerrado
+            with conn:
+                conn.settimeout(IPC_TIMEOUT)
+                try:
+                    with conn.makefile('rb') as lines:
+                        for line in iter(lambda: lines.readline(IPC_MAX_MESSAGE + 1), b''):
+                            if len(line) > IPC_MAX_MESSAGE:
+                                raise ValueError("mensaje demasiado largo")
+                            message = json.loads(line)
+                            if not isinstance(message, dict):
+                                raise ValueError(f"mensaje inválido: {message!r}")
+                            self.handler(message)
+                except Exception as e:
+                    self._log_error(f"Error procesando mensaje IPC: {e}")
+
+    def close(self):
+        self._sock.close()
+
+    def _log_error(self, message):
+        if self.logger:
+            self.logger.error(message)
+        else:
+            print(message)
+
+
+def notify(message, address=IPC_ADDRESS):
+    """Envía `message` al servidor web; False si no está escuchando."""
+    try:
+        data = (json.dumps(message, default=str) + '\n').encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(IPC_TIMEOUT)
+            conn.connect(address)
+            conn.sendall(data)
+        return True
+    except (OSError, ValueError, TypeError):
+        return False
@@ -0,0 +1,119 @@
+"""
+Tareas en segundo plano: sincronización con el CMS, reporte de
+activaciones y limpieza de videos huérfanos. Se ejecutan en su propio proceso (`python -m vitrina jobs`)
+con prioridad de CPU y de disco reducidas, para que una descarga grande no
+compita con la reproducción de video ni con la lectura de sensores.
+"""
+import os
+import threading
+from datetime import datetime
+
+import psutil
+
+import ipc
+
+REPORT_INTERVAL = 600  # segundos entre reportes de activaciones
+CMS_SYNC_MIN_INTERVAL = 60  # segundos entre sincronizaciones tras un cambio
+CMS_SYNC_MAX_INTERVAL = 15 * 60  # tope cuando el CMS no cambia
+CMS_SYNC_BACKOFF = 2  # factor de espaciado por cada sincronización sin cambios
+MEDIA_GC_INTERVAL = 6 * 3600  # segundos entre recolecciones de videos huérfanos
+JOBS_NICENESS = 10  # se suma a la prioridad de CPU del proceso
+
+
+def lower_priority():
+    """Baja la prioridad de CPU (nice) y de E/S (clase idle de ionice)."""
+    try:
+        os.nice(JOBS_NICENESS)
+    except OSError as e:
+        print(f"No se pudo cambiar la prioridad de CPU: {e}")
+    try:
+        psutil.Process().ionice(psutil.IOPRIO_CLASS_IDLE)
+    except (AttributeError, OSError, psutil.Error) as e:
+        print(f"No se pudo cambiar la prioridad de E/S: {e}")
+
+
+class AdaptiveInterval:
+    """
+    Intervalo que se multiplica por `factor` (hasta `maximum`) cada vez que
+    la tarea no encuentra cambios y vuelve a `minimum` apenas hay uno.
+    """
+
+    def __init__(self, minimum, maximum, factor=2):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.current = minimum
+
+    def next(self, changed):
+        if changed:
+            self.current = self.minimum
+        else:
+            self.current = min(self.current * self.factor, self.maximum)
+        return self.current
+
+
+def report_activations():
+    from workers import send_data_to_server
+    return send_data_to_server()
+
+
+def sync_cms():
+    from cms import get_media
+    return get_media()
+
+
+def collect_media():
+    from media_gc import collect
+    collect()
+
+
+def run_periodic(name, func, interval, stop_event=None):
+    """
+    Ejecuta `func` cada `interval` segundos hasta `stop_event`. Un error no
+    detiene la tarea: se registra y se reintenta en la siguiente vuelta.
+    Con un AdaptiveInterval, el valor que devuelve `func` indica si hubo
+    cambios. Cada ejecución se informa al servidor web por IPC.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        started = datetime.now()
+        status = {'type': 'job_status', 'job': name, 'started': started.isoformat()}
+        changed = False
+        try:
+            changed = func()
+            status['ok'] = True
+        except Exception as e:
+            print(f"Error en tarea {name}: {e}")
+            status.update(ok=False, error=str(e))
+        delay = interval.next(changed) if isinstance(interval, AdaptiveInterval) else interval
+        status.update(finished=datetime.now().isoformat(), next_run_in=delay)
+        ipc.notify(status)
+        stop_event.wait(delay)
+
+
+JOBS = {
+    'report': (report_activations, REPORT_INTERVAL),
+    'cms_sync': (sync_cms, AdaptiveInterval(CMS_SYNC_MIN_INTERVAL, CMS_SYNC_MAX_INTERVAL,
+                                            CMS_SYNC_BACKOFF)),
+    'media_gc': (collect_media, MEDIA_GC_INTERVAL),
+}
+
+
+def start_threads(stop_event=None):
+    threads = []
+    for name, (func, interval) in JOBS.items():
+        thread = threading.Thread(target=run_periodic, name=f'job-{name}',
+                                  args=(name, func, interval, stop_event), daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def run():
+    lower_priority()
+    for thread in start_threads():
+        thread.join()
+
+
+if __name__ == '__main__':
+    run()
@@ -1,3 +1,3 @@
 #!/bin/bash
 source /home/pi/vitrina/venv/bin/activate
-/usr/bin/sudo /home/pi/vitrina/venv/bin/python /home/pi/vitrina/app.py
+/usr/bin/sudo /home/pi/vitrina/venv/bin/python /home/pi/vitrina/vitrina.py run
@@ -0,0 +1,182 @@
+"""
+Metadatos precalculados de los videos servidos por /media.
+
+Por cada archivo se guarda junto a él un sidecar `<archivo>.meta.json` con
+tamaño, mtime, sha256 y, para MP4/MOV, duración, códecs y posición del átomo
+moov. El hash da URLs versionadas (`/media/videos/x.mp4?v=<hash>`) que el
+navegador puede cachear como inmutables; el sidecar evita volver a leer el
+video completo en cada arranque.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+
+MEDIA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+SIDECAR_SUFFIX = '.meta.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+URL_HASH_LENGTH = 16
+MP4_EXTENSIONS = {'.mp4', '.mov', '.m4v'}
+
+# Cajas ISO-BMFF que contienen otras cajas, en el camino moov → stsd
+_CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+_cache = {}  # ruta absoluta -> metadatos
+_lock = threading.Lock()
+
+
+def media_path(rel_path):
+    """Ruta absoluta bajo MEDIA_ROOT; None si `rel_path` intenta salir de ella."""
+    path = os.path.realpath(os.path.join(MEDIA_ROOT, rel_path))
+    if not path.startswith(os.path.realpath(MEDIA_ROOT) + os.sep):
+        return None
+    return path
+
+
+def _iter_boxes(f, start, end):
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack('>I4s', f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            return
+        yield kind, pos, header_size, size
+        pos += size
+
+
+def _probe_moov(f, start, end, info):
+    for kind, pos, header_size, size in _iter_boxes(f, start, end):
+        body = pos + header_size
+        if kind in _CONTAINER_BOXES:
+            _probe_moov(f, body, pos + size, info)
+        elif kind == b'mvhd':
+            f.seek(body)
+            version = f.read(4)[0]
+            if version == 1:
+                f.seek(16, os.SEEK_CUR)
+                timescale, duration = struct.unpack('>IQ', f.read(12))
+            else:
+                f.seek(8, os.SEEK_CUR)
+                timescale, duration = struct.unpack('>II', f.read(8))
+            if timescale:
+                info['duration'] = round(duration / timescale, 3)
+        elif kind == b'stsd':
+            # versión/flags (4), cantidad de entradas (4), tamaño (4), formato (4)
+            f.seek(body + 12)
+            codec = f.read(4).decode('latin-1').strip()
+            if codec and codec not in info['codecs']:
+                info['codecs'].append(codec)
+
+
+def probe_mp4(path, size):
+    """
+    Recorre las cajas de primer nivel: posición de moov y mdat (moov antes
+    que mdat = "faststart", reproducible sin descargar el final del archivo),
+    duración de mvhd y el formato de cada pista en stsd.
+    """
+    info = {'duration': None, 'codecs': [], 'moov_offset': None,
+            'mdat_offset': None, 'faststart': None}
+    with open(path, 'rb') as f:
+        for kind, pos, header_size, box_size in _iter_boxes(f, 0, size):
+            if kind == b'moov':
+                info['moov_offset'] = pos
+                _probe_moov(f, pos + header_size, pos + box_size, info)
+            elif kind == b'mdat' and info['mdat_offset'] is None:
+                info['mdat_offset'] = pos
+    if info['moov_offset'] is not None and info['mdat_offset'] is not None:
+        info['faststart'] = info['moov_offset'] < info['mdat_offset']
+    return info
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compute(path, stat, sha256=None):
+    meta = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256 or file_sha256(path)}
+    if os.path.splitext(path)[1].lower() in MP4_EXTENSIONS:
+        try:
+            meta.update(probe_mp4(path, stat.st_size))
+        except (OSError, struct.error, IndexError) as e:
+            print(f"No se pudo analizar {path}: {e}")
+    return meta
+
+
+def _read_sidecar(path, stat):
+    try:
+        with open(path + SIDECAR_SUFFIX) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('size') != stat.st_size or meta.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return meta
+
+
+def _write_sidecar(path, meta):
+    tmp_path = path + SIDECAR_SUFFIX + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path + SIDECAR_SUFFIX)
+    except OSError as e:
+        print(f"No se pudo escribir metadatos de {path}: {e}")
+
+
+def metadata(path, sha256=None):
+    """
+    Metadatos de `path` (ruta absoluta), desde memoria, desde el sidecar si
+    sigue vigente (mismo tamaño y mtime) o recalculados. None si no existe.
+    Si quien llama ya conoce el `sha256` del archivo, no se vuelve a leer.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    with _lock:
+        meta = _cache.get(path)
+    if meta and meta['size'] == stat.st_size and meta['mtime_ns'] == stat.st_mtime_ns:
+        return meta
+
+    meta = _read_sidecar(path, stat)
+    if meta is None:
+        meta = _compute(path, stat, sha256)
+        _write_sidecar(path, meta)
+    with _lock:
+        _cache[path] = meta
+    return meta
+
+
+def url_for_media(rel_path):
+    """
+    URL de /media para un `video_path` de la base (relativo a static/). Lleva
+    el hash del contenido como versión; si el archivo no existe se devuelve
+    sin versión, de modo que el navegador no la guarde como inmutable.
+    """
+    if not rel_path:
+        return None
+    path = media_path(rel_path)
+    meta = metadata(path) if path else None
+    if meta is None:
+        return f'/media/{rel_path}'
+    return f"/media/{rel_path}?v={meta['sha256'][:URL_HASH_LENGTH]}"
+
+
+if __name__ == '__main__':
+    import sys
+    for rel_path in sys.argv[1:]:
+        path = media_path(rel_path)
+        print(rel_path, json.dumps(metadata(path) if path else None, indent=2))
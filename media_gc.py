@@ -0,0 +1,223 @@
+"""
+Recolección de videos huérfanos en static/videos y en la antigua carpeta cms/.
+
+Un archivo está vivo si lo referencia sensor_videos, background_videos,
+extra_content o la lista de videos del último manifiesto procesado de cada
+pantalla (cms_manifests.video_paths). media_files no cuenta como referencia:
+es solo el índice nombre → contenido del almacén.
+
+Lo no referenciado pasa a media_quarantine/<fecha>/ y se borra a los
+QUARANTINE_DAYS días; si el disco está casi lleno se borra de inmediato
+(la reproducción se entrecorta con la SD llena). También se limpian los
+temporales de descargas y subidas abandonadas (.part, .validator, .cms) y los sidecars
+.meta.json sin video. Los archivos más nuevos que GC_GRACE_SECONDS no se
+tocan: pueden ser una subida o descarga que aún no se registró.
+
+    python media_gc.py --dry-run   # solo informa qué se liberaría
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import database
+import media
+import media_registry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEGACY_CMS_FOLDER = os.path.join(BASE_DIR, 'cms')  # descargas del CMS antes del almacén
+QUARANTINE_FOLDER = os.path.join(BASE_DIR, 'media_quarantine')
+QUARANTINE_DAYS = 7
+GC_GRACE_SECONDS = 6 * 3600  # antigüedad mínima para considerar huérfano un archivo
+TEMP_MAX_AGE = 24 * 3600  # temporales más viejos se dan por abandonados
+MIN_FREE_RATIO = 0.10  # bajo este espacio libre se borra sin pasar por cuarentena
+TEMP_SUFFIXES = ('.part', '.validator', '.cms', '.tmp')
+
+# Consultas de referencias vivas (rutas relativas a static/)
+REFERENCE_QUERIES = {
+    'sensor_videos': 'SELECT video_path FROM sensor_videos',
+    'background_videos': 'SELECT video_path FROM background_videos',
+    'extra_content': 'SELECT content_path FROM extra_content',
+}
+
+
+def _resolve(path):
+    """
+    Rutas absolutas con las que puede estar guardada una referencia: relativa
+    a static/, absoluta o, en registros antiguos, solo el nombre en videos/.
+    """
+    paths = {os.path.realpath(os.path.join(media_registry.VIDEOS_FOLDER, os.path.basename(path)))}
+    if os.path.isabs(path):
+        paths.add(os.path.realpath(path))
+    else:
+        resolved = media.media_path(path)
+        if resolved:
+            paths.add(resolved)
+    return paths
+
+
+def live_paths(conn):
+    """Conjunto de rutas absolutas referenciadas por la base."""
+    references = []
+    for table, sql in REFERENCE_QUERIES.items():
+        try:
+            references.extend(row[0] for row in conn.execute(sql))
+        except sqlite3.OperationalError as e:
+            print(f"GC: no se pudo leer {table}: {e}")
+    for (video_paths,) in conn.execute(
+            'SELECT video_paths FROM cms_manifests WHERE video_paths IS NOT NULL'):
+        try:
+            references.extend(json.loads(video_paths))
+        except ValueError:
+            pass
+
+    live = set()
+    for path in references:
+        if path:
+            live |= _resolve(path)
+    return live
+
+
+def _walk(folder):
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            yield os.path.join(root, name)
+
+
+def _candidates(live, now):
+    """(ruta, tamaño, motivo) de cada archivo que se puede eliminar."""
+    for path in _walk(media_registry.VIDEOS_FOLDER):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        age = now - stat.st_mtime
+        name = os.path.basename(path)
+
+        if name.endswith(media.SIDECAR_SUFFIX):
+            video = path[:-len(media.SIDECAR_SUFFIX)]
+            if not os.path.exists(video):
+                yield path, stat.st_size, 'sidecar_huerfano'
+        elif name.endswith(TEMP_SUFFIXES):
+            if age > TEMP_MAX_AGE:
+                yield path, stat.st_size, 'temporal'
+        elif os.path.realpath(path) not in live and age > GC_GRACE_SECONDS:
+            yield path, stat.st_size, 'sin_referencias'
+
+    if os.path.isdir(LEGACY_CMS_FOLDER):
+        for path in _walk(LEGACY_CMS_FOLDER):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if os.path.realpath(path) not in live and now - stat.st_mtime > GC_GRACE_SECONDS:
+                yield path, stat.st_size, 'cms_antiguo'
+
+
+def disk_pressure(path=media.MEDIA_ROOT):
+    usage = shutil.disk_usage(path)
+    return usage.free / usage.total < MIN_FREE_RATIO
+
+
+def _quarantine(path, today):
+    dest = os.path.join(QUARANTINE_FOLDER, today, os.path.relpath(path, BASE_DIR))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    shutil.move(path, dest)
+    return dest
+
+
+def _expired_quarantine(now, purge_all):
+    """Carpetas de cuarentena a borrar: las vencidas, o todas con el disco lleno."""
+    if not os.path.isdir(QUARANTINE_FOLDER):
+        return []
+    limit = (datetime.fromtimestamp(now) - timedelta(days=QUARANTINE_DAYS)).strftime('%Y%m%d')
+    return [os.path.join(QUARANTINE_FOLDER, day)
+            for day in sorted(os.listdir(QUARANTINE_FOLDER))
+            if purge_all or day < limit]
+
+
+def collect(dry_run=False, now=None):
+    """
+    Elimina o pone en cuarentena los archivos sin referencias. Con
+    `dry_run` no toca nada. Devuelve un informe con cada archivo, el motivo
+    y la acción, y los bytes liberados.
+    """
+    now = now or time.time()
+    today = datetime.fromtimestamp(now).strftime('%Y%m%d')
+    pressure = disk_pressure()
+    report = {'dry_run': dry_run, 'disk_pressure': pressure, 'files': [],
+              'freed_bytes': 0, 'quarantine_purged': []}
+
+    with database.connection() as conn:
+        # Con el lock de escritura tomado nadie puede asignar un video
+        # mientras se decide qué está vivo y se mueve lo demás; store y link
+        # toman el mismo lock y renuevan el mtime de lo que reutilizan, así
+        # que lo recién registrado queda dentro de GC_GRACE_SECONDS
+        if not dry_run:
+            conn.execute('BEGIN IMMEDIATE')
+        live = live_paths(conn)
+        removed_paths = []
+        for path, size, reason in _candidates(live, now):
+            # Temporales y sidecars no tienen nada que recuperar
+            delete = pressure or reason in ('temporal', 'sidecar_huerfano')
+            action = 'eliminado' if delete else 'cuarentena'
+            entry = {'path': os.path.relpath(path, BASE_DIR), 'size': size,
+                     'reason': reason, 'action': action}
+            report['files'].append(entry)
+            if dry_run:
+                report['freed_bytes'] += size
+                continue
+            try:
+                if delete:
+                    os.remove(path)
+                else:
+                    entry['quarantine'] = os.path.relpath(_quarantine(path, today), BASE_DIR)
+                report['freed_bytes'] += size
+            except OSError as e:
+                entry['error'] = str(e)
+                print(f"GC: no se pudo eliminar {path}: {e}")
+                continue
+            if reason == 'sin_referencias':
+                sidecar = path + media.SIDECAR_SUFFIX
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+                removed_paths.append(os.path.relpath(path, media.MEDIA_ROOT))
+
+        if removed_paths:
+            conn.executemany('DELETE FROM media_files WHERE video_path = ?',
+                             [(p,) for p in removed_paths])
+
+    for folder in _expired_quarantine(now, pressure):
+        report['quarantine_purged'].append(os.path.relpath(folder, BASE_DIR))
+        if not dry_run:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if removed_paths:
+        media_registry.notify_change('media_files')
+    if report['files'] or report['quarantine_purged']:
+        prefix = 'GC (simulación)' if dry_run else 'GC'
+        print(f"{prefix}: {len(report['files'])} archivos, "
+              f"{report['freed_bytes'] / 1024 / 1024:.1f} MB, "
+              f"{len(report['quarantine_purged'])} carpetas de cuarentena vencidas")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recolección de videos huérfanos')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='solo informa qué se eliminaría')
+    args = parser.parse_args(argv)
+    report = collect(dry_run=args.dry_run)
+    for entry in report['files']:
+        print(f"{entry['action']:<10} {entry['reason']:<17} "
+              f"{entry['size'] / 1024 / 1024:8.1f} MB  {entry['path']}")
+    for folder in report['quarantine_purged']:
+        print(f"{'purgado':<10} {'cuarentena':<17} {'':>11}  {folder}")
+    print(f"Total: {report['freed_bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
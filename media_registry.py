@@ -0,0 +1,251 @@
+"""
+Registro de videos ya presentes en disco.
+
+Lo usan tanto las subidas HTTP (`upload_video`, `upload_background_video`)
+como la sincronización con el CMS, que antes re-subía por HTTP a
+localhost:5000 los archivos que acababa de descargar. Cada registro mueve el
+archivo a static/videos con un rename atómico (sin copiar bytes), actualiza
+la base en una transacción y avisa del cambio para que el catálogo se
+recargue.
+
+Los archivos se guardan direccionados por contenido: `videos/<sha256>.<ext>`.
+La tabla media_files relaciona cada nombre lógico (nombre subido o nombre en
+el CMS) con su hash, así que un mismo video usado por varios sensores o como
+fondo se guarda una sola vez, y un archivo que cambia de contenido con el
+mismo nombre obtiene una ruta nueva (y una URL nueva para el navegador).
+"""
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+
+import database
+import ipc
+import media
+
+VIDEOS_FOLDER = os.path.join(media.MEDIA_ROOT, 'videos')
+
+# Callback `handler(*tablas)` para avisar cambios dentro del mismo proceso
+# (el servidor web lo apunta a catalog.refresh). Sin él, el aviso se envía
+# al servidor web por IPC.
+change_handler = None
+
+
+def notify_change(*tables):
+    if change_handler is not None:
+        change_handler(*tables)
+    else:
+        ipc.notify({'type': 'catalog', 'tables': list(tables)})
+
+
+def incoming_path(filename):
+    """
+    Temporal nuevo y único en VIDEOS_FOLDER para recibir un archivo antes de
+    registrarlo (dos subidas simultáneas del mismo nombre no se pisan).
+    """
+    os.makedirs(VIDEOS_FOLDER, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f'.{filename}.', suffix='.part', dir=VIDEOS_FOLDER)
+    os.close(fd)
+    os.chmod(path, 0o644)  # mkstemp lo crea 0600; es un video público
+    return path
+
+
+class VerificationError(Exception):
+    pass
+
+
+def verify(path, size=None, sha256=None, md5=None):
+    """
+    Compara el archivo con el tamaño y/o hash informados (por el CMS).
+    Devuelve el sha256 calculado; lanza VerificationError si no coincide.
+    """
+    actual_size = os.path.getsize(path)
+    if size is not None and int(size) != actual_size:
+        raise VerificationError(f"{path}: tamaño {actual_size}, se esperaba {size}")
+    actual_sha256 = media.file_sha256(path)
+    if sha256 and sha256.lower() != actual_sha256:
+        raise VerificationError(f"{path}: sha256 {actual_sha256}, se esperaba {sha256}")
+    if md5:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(media.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        if md5.lower() != digest.hexdigest():
+            raise VerificationError(f"{path}: md5 {digest.hexdigest()}, se esperaba {md5}")
+    return actual_sha256
+
+
+def lookup(name):
+    """Fila de media_files para un nombre lógico como dict, o None."""
+    with database.connection() as conn:
+        row = conn.execute('''
+            SELECT name, video_path, sha256, size, source_url, etag
+            FROM media_files WHERE name = ?
+        ''', (name,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(('name', 'video_path', 'sha256', 'size', 'source_url', 'etag'), row))
+
+
+def find_by_sha256(sha256):
+    """video_path de un objeto ya almacenado con ese hash y presente en disco."""
+    with database.connection() as conn:
+        rows = conn.execute('SELECT DISTINCT video_path FROM media_files WHERE sha256 = ?',
+                            (sha256.lower(),)).fetchall()
+    for (video_path,) in rows:
+        if os.path.exists(media.media_path(video_path)):
+            return video_path
+    return None
+
+
+def store(src_path, name, sha256=None, source_url=None, etag=None):
+    """
+    Guarda `src_path` como videos/<sha256><ext> y asocia `name` a ese hash.
+    Si el contenido ya estaba almacenado, se descarta `src_path` (dedup).
+    El rename es atómico: el kiosko nunca ve un archivo a medio escribir.
+    Devuelve el video_path relativo a static/.
+    """
+    os.makedirs(VIDEOS_FOLDER, exist_ok=True)
+    sha256 = sha256 or media.file_sha256(src_path)
+    ext = os.path.splitext(name)[1].lower()
+    filename = f'{sha256}{ext}'
+    dest_path = os.path.join(VIDEOS_FOLDER, filename)
+    size = os.path.getsize(src_path)
+    video_path = os.path.join('videos', filename)
+
+    with database.connection() as conn:
+        # Con el lock de escritura media_gc.collect no puede estar moviendo
+        # archivos: si el destino existe ahora, _touch lo deja fuera del GC
+        # hasta que se asigne (GC_GRACE_SECONDS); si ya se lo llevó, se usa src
+        conn.execute('BEGIN IMMEDIATE')
+        if os.path.exists(dest_path):
+            if os.path.abspath(src_path) != os.path.abspath(dest_path):
+                os.remove(src_path)
+            _touch(dest_path)
+        else:
+            os.replace(src_path, dest_path)
+        _record(conn, name, video_path, sha256, size, source_url, etag)
+    media.metadata(dest_path, sha256)
+    return video_path
+
+
+def link(name, video_path, sha256, size, source_url=None, etag=None):
+    """
+    Asocia `name` a un objeto ya almacenado, sin tocar su contenido.
+    Devuelve False si el archivo ya no está (lo recolectó media_gc).
+    """
+    with database.connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')  # ver store
+        path = media.media_path(video_path)
+        if not path or not os.path.exists(path):
+            return False
+        _touch(path)
+        _record(conn, name, video_path, sha256, size, source_url, etag)
+    return True
+
+
+def _touch(path):
+    """
+    Renueva el mtime de un archivo que se vuelve a usar: media_gc no toca
+    archivos más nuevos que GC_GRACE_SECONDS, así que no puede recolectarlo
+    entre el registro y la asignación al sensor o a la playlist.
+    """
+    os.utime(path)
+
+
+def _record(conn, name, video_path, sha256, size, source_url, etag):
+    conn.execute('''
+        INSERT OR REPLACE INTO media_files
+        (name, video_path, sha256, size, source_url, etag, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (name, video_path, sha256, size, source_url, etag,
+          datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+
+def assign_sensor_video(sensor_id, video_path):
+    """Asigna al sensor un video ya almacenado (reemplaza el anterior)."""
+    with database.connection() as conn:
+        conn.execute('''INSERT OR REPLACE INTO sensor_videos (sensor_id, video_path)
+                        VALUES (?, ?)''', (sensor_id, video_path))
+    notify_change('sensor_videos', 'media_files')
+
+
+def add_background_video(video_path):
+    """Agrega un video ya almacenado al final de la playlist de fondo. Devuelve el id."""
+    with database.connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT MAX(orden) FROM background_videos')
+        max_orden = c.fetchone()[0] or 0
+        c.execute('INSERT INTO background_videos (video_path, orden) VALUES (?, ?)',
+                  (video_path, max_orden + 1))
+        video_id = c.lastrowid
+    notify_change('background_videos', 'media_files')
+    return video_id
+
+
+def sensor_video_path(sensor_id):
+    with database.connection() as conn:
+        row = conn.execute('SELECT video_path FROM sensor_videos WHERE sensor_id = ?',
+                           (sensor_id,)).fetchone()
+    return row[0] if row else None
+
+
+def background_video_id(video_path):
+    with database.connection() as conn:
+        row = conn.execute('SELECT id FROM background_videos WHERE video_path = ?',
+                           (video_path,)).fetchone()
+    return row[0] if row else None
+
+
+def register_sensor_video(src_path, sensor_id, filename=None):
+    """Almacena el archivo y lo asigna al sensor. Devuelve el video_path."""
+    video_path = store(src_path, filename or os.path.basename(src_path))
+    assign_sensor_video(sensor_id, video_path)
+    return video_path
+
+
+def register_background_video(src_path, filename=None):
+    """Almacena el archivo y lo agrega a la playlist de fondo. Devuelve (id, video_path)."""
+    video_path = store(src_path, filename or os.path.basename(src_path))
+    return add_background_video(video_path), video_path
+
+
+def move_background_video(video_id, direction):
+    """Intercambia el video con el anterior ('up') o el siguiente ('down')."""
+    with database.connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT orden FROM background_videos WHERE id = ?', (video_id,))
+        row = c.fetchone()
+        if row is None:
+            raise ValueError(f"Video de fondo {video_id} no existe")
+        current_order = row[0]
+
+        if direction == 'up' and current_order > 1:
+            c.execute('''
+                UPDATE background_videos
+                SET orden = CASE
+                    WHEN orden = ? THEN orden - 1
+                    WHEN orden = ? - 1 THEN orden + 1
+                END
+                WHERE orden IN (?, ? - 1)
+            ''', (current_order, current_order, current_order, current_order))
+        elif direction == 'down':
+            c.execute('''
+                UPDATE background_videos
+                SET orden = CASE
+                    WHEN orden = ? THEN orden + 1
+                    WHEN orden = ? + 1 THEN orden - 1
+                END
+                WHERE orden IN (?, ? + 1)
+            ''', (current_order, current_order, current_order, current_order))
+    notify_change('background_videos')
+
+
+def set_sensor_label(sensor_id, nombre_fantasia):
+    with database.connection() as conn:
+        conn.execute('''
+            UPDATE etiquetas_sensores
+            SET nombre_fantasia = ?
+            WHERE gpio_pin = ?
+        ''', (nombre_fantasia, sensor_id))
+    notify_change('etiquetas_sensores')
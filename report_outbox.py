@@ -0,0 +1,78 @@
+"""
+Outbox de activaciones completadas para el reporte al servidor.
+
+Los triggers de la migración 6 agregan una fila a report_outbox en la misma
+transacción en que una activación queda completada, con una clave de
+idempotencia aleatoria que no cambia entre reintentos. report_cursor guarda
+el último id del outbox que el servidor confirmó: cada reporte envía solo lo
+que está después del cursor, así una activación no se reenvía en cada ciclo
+y las que se acumulan durante un corte de internet se envían al volver.
+
+El cursor es sobre report_outbox.id y no sobre activaciones.id porque las
+activaciones se completan en otro orden que el de inicio: un cursor sobre
+activaciones.id saltaría las que terminaron después de una más nueva.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import database
+
+CURSOR_NAME = 'activaciones'
+OUTBOX_RETENTION_DAYS = 30  # filas ya confirmadas que se conservan
+
+
+def cursor(conn):
+    row = conn.execute('SELECT last_outbox_id FROM report_cursor WHERE name = ?',
+                       (CURSOR_NAME,)).fetchone()
+    return row[0] if row else 0
+
+
+def pending(limit):
+    """
+    Hasta `limit` filas después del cursor, en orden: (outbox_id, fila) con
+    la fila de v_activaciones como dict más su `idempotency_key`. La fila es
+    None si la activación ya no existe (se avanza el cursor sobre ella igual).
+    """
+    with database.connection(sqlite3.Row) as conn:
+        rows = conn.execute('''
+            SELECT o.id AS outbox_id, o.idempotency_key, v.*
+            FROM report_outbox o
+            LEFT JOIN v_activaciones v ON v.id = o.activation_id
+            WHERE o.id > ?
+            ORDER BY o.id
+            LIMIT ?
+        ''', (cursor(conn), limit)).fetchall()
+    batch = []
+    for row in rows:
+        item = dict(row)
+        outbox_id = item.pop('outbox_id')
+        batch.append((outbox_id, item if item['id'] is not None else None))
+    return batch
+
+
+def backlog():
+    """Cantidad de filas aún sin confirmar."""
+    with database.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM report_outbox WHERE id > ?',
+                            (cursor(conn),)).fetchone()[0]
+
+
+def acknowledge(outbox_id):
+    """Avanza el cursor hasta `outbox_id` (nunca lo retrocede)."""
+    now = datetime.now().strftime(database.DATETIME_FORMAT)
+    with database.connection() as conn:
+        conn.execute('''
+            INSERT INTO report_cursor (name, last_outbox_id, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                last_outbox_id = MAX(last_outbox_id, excluded.last_outbox_id),
+                updated_at = excluded.updated_at
+        ''', (CURSOR_NAME, outbox_id, now))
+
+
+def prune(days=OUTBOX_RETENTION_DAYS):
+    """Borra filas confirmadas con más de `days` días."""
+    limit = (datetime.now() - timedelta(days=days)).strftime(database.DATETIME_FORMAT)
+    with database.connection() as conn:
+        conn.execute('DELETE FROM report_outbox WHERE id <= ? AND created_at < ?',
+                     (cursor(conn), limit))
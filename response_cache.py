@@ -0,0 +1,113 @@
+import functools
+import threading
+import time
+from collections import Counter
+
+from flask import Response, request
+
+
+class ResponseCache:
+    """
+    Caché en memoria de respuestas JSON de solo lectura.
+
+    La clave es el endpoint más los parámetros de la query ordenados, así
+    `?from=a&to=b` y `?to=b&from=a` comparten entrada. Cada endpoint declara
+    su TTL y las etiquetas de datos de las que depende ('activaciones',
+    'sensor_videos', 'etiquetas_sensores'); `invalidate(etiqueta)` descarta
+    de inmediato todas las entradas que dependen de ella.
+
+    Solo se guardan respuestas 200; los errores se recalculan siempre.
+    Cada etiqueta tiene un contador que sube con cada invalidación: una
+    respuesta calculada mientras se invalidaba una de sus etiquetas se
+    devuelve pero no se guarda, porque puede tener datos de antes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # clave -> (expira, etiquetas, cuerpo, mimetype)
+        self._generations = Counter()  # etiqueta -> invalidaciones
+        self._generation = 0  # invalidaciones totales (invalidate sin etiquetas)
+        self._hits = Counter()
+        self._misses = Counter()
+
+    def cached(self, ttl, tags=()):
+        # Un str suelto se trata como una sola etiqueta, no como sus caracteres
+        tags = frozenset((tags,) if isinstance(tags, str) else tags)
+
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (request.endpoint,
+                       tuple(sorted(kwargs.items())),
+                       tuple(sorted(request.args.items(multi=True))))
+                entry = self._get(key)
+                if entry is not None:
+                    body, mimetype = entry
+                    return Response(body, mimetype=mimetype)
+
+                generation = self._snapshot(tags)
+                response = view(*args, **kwargs)
+                if isinstance(response, Response) and response.status_code == 200:
+                    self._put(key, ttl, tags, response.get_data(), response.mimetype,
+                              generation)
+                return response
+            return wrapper
+        return decorator
+
+    def _get(self, key):
+        endpoint = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._hits[endpoint] += 1
+                return entry[2], entry[3]
+            self._entries.pop(key, None)
+            self._misses[endpoint] += 1
+            return None
+
+    def _snapshot(self, tags):
+        with self._lock:
+            return self._generation_of(tags)
+
+    def _generation_of(self, tags):
+        # Llamar con el lock tomado
+        return self._generation, tuple(self._generations[tag] for tag in sorted(tags))
+
+    def _put(self, key, ttl, tags, body, mimetype, generation):
+        with self._lock:
+            if generation != self._generation_of(tags):
+                return  # se invalidó mientras se calculaba
+            self._entries[key] = (time.monotonic() + ttl, tags, body, mimetype)
+
+    def invalidate(self, *tags):
+        """Descarta las entradas que dependen de alguna de `tags` (todas si no se indica)."""
+        with self._lock:
+            if not tags:
+                self._generation += 1
+                self._entries.clear()
+                return
+            self._generations.update(tags)
+            stale = [key for key, entry in self._entries.items()
+                     if entry[1].intersection(tags)]
+            for key in stale:
+                del self._entries[key]
+
+    def stats(self):
+        """Aciertos y fallos por endpoint, más las entradas vigentes."""
+        with self._lock:
+            endpoints = sorted(set(self._hits) | set(self._misses))
+            return {
+                'entries': len(self._entries),
+                'endpoints': {
+                    endpoint: {
+                        'hits': self._hits[endpoint],
+                        'misses': self._misses[endpoint],
+                    }
+                    for endpoint in endpoints
+                },
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
@@ -0,0 +1,113 @@
+"""
+Tablas de resumen por (sensor, hora) y (sensor, día).
+
+Se actualizan en la misma transacción que registra cada activación, así el
+dashboard lee O(sensores × buckets) filas en vez de recorrer activaciones.
+`python rollups.py --backfill` las reconstruye desde el histórico.
+"""
+import argparse
+
+import database
+
+
+def _bucket(when):
+    return when.strftime('%Y-%m-%d'), when.hour
+
+
+def record_start(c, sensor_id, when):
+    """Cuenta una activación nueva en el bucket de su hora de inicio."""
+    date, hour = _bucket(when)
+    c.execute('''
+        INSERT INTO sensor_stats_hourly (sensor_id, hour, date, total_activations)
+        VALUES (?, ?, ?, 1)
+        ON CONFLICT(sensor_id, hour, date)
+        DO UPDATE SET total_activations = total_activations + 1
+    ''', (sensor_id, hour, date))
+    c.execute('''
+        INSERT INTO sensor_stats_daily (sensor_id, date, total_activations)
+        VALUES (?, ?, 1)
+        ON CONFLICT(sensor_id, date)
+        DO UPDATE SET total_activations = total_activations + 1
+    ''', (sensor_id, date))
+
+
+def record_completion(c, sensor_id, started, duration):
+    """Suma una activación completada y su duración (ms) al bucket de inicio."""
+    date, hour = _bucket(started)
+    c.execute('''
+        INSERT INTO sensor_stats_hourly
+        (sensor_id, hour, date, total_activations, completed_activations, total_duration, avg_duration)
+        VALUES (?, ?, ?, 0, 1, ?, ? / 1000.0)
+        ON CONFLICT(sensor_id, hour, date) DO UPDATE SET
+            completed_activations = completed_activations + 1,
+            total_duration = total_duration + excluded.total_duration,
+            avg_duration = CAST(total_duration + excluded.total_duration AS FLOAT)
+                           / (completed_activations + 1) / 1000
+    ''', (sensor_id, hour, date, duration, duration))
+    c.execute('''
+        INSERT INTO sensor_stats_daily
+        (sensor_id, date, total_activations, completed_activations, total_duration)
+        VALUES (?, ?, 0, 1, ?)
+        ON CONFLICT(sensor_id, date) DO UPDATE SET
+            completed_activations = completed_activations + 1,
+            total_duration = total_duration + excluded.total_duration
+    ''', (sensor_id, date, duration))
+
+
+def clear(c):
+    c.execute('DELETE FROM sensor_stats_hourly')
+    c.execute('DELETE FROM sensor_stats_daily')
+
+
+def rebuild(c):
+    """
+    Recalcula ambas tablas desde activaciones dentro de la transacción en
+    curso. Fecha y hora se toman del texto del timestamp (hora local), igual
+    que los buckets incrementales.
+    """
+    clear(c)
+    c.execute('''
+        INSERT INTO sensor_stats_hourly
+        (sensor_id, hour, date, total_activations, completed_activations, total_duration, avg_duration)
+        SELECT
+            sensor_id,
+            CAST(substr(timestamp, 12, 2) AS INTEGER) as hour,
+            substr(timestamp, 1, 10) as date,
+            COUNT(*),
+            SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END),
+            SUM(CASE WHEN completed = 1 THEN duration ELSE 0 END),
+            CAST(SUM(CASE WHEN completed = 1 THEN duration ELSE 0 END) AS FLOAT)
+                / NULLIF(SUM(CASE WHEN completed = 1 THEN 1 ELSE 0 END), 0) / 1000
+        FROM activaciones
+        WHERE timestamp IS NOT NULL
+        GROUP BY sensor_id, date, hour
+    ''')
+    c.execute('''
+        INSERT INTO sensor_stats_daily
+        (sensor_id, date, total_activations, completed_activations, total_duration)
+        SELECT sensor_id, date, SUM(total_activations),
+               SUM(completed_activations), SUM(total_duration)
+        FROM sensor_stats_hourly
+        GROUP BY sensor_id, date
+    ''')
+    return c.execute('SELECT COUNT(*) FROM sensor_stats_hourly').fetchone()[0]
+
+
+def backfill(conn):
+    """Reconstruye las tablas de resumen en una sola transacción."""
+    with conn:
+        return rebuild(conn.cursor())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tablas de resumen de activaciones')
+    parser.add_argument('--backfill', action='store_true',
+                        help='reconstruir las tablas de resumen desde el histórico')
+    args = parser.parse_args()
+    if args.backfill:
+        with database.connection() as conn:
+            database.migrate(conn)
+            buckets = backfill(conn)
+        print(f"Resúmenes reconstruidos: {buckets} buckets por hora")
+    else:
+        parser.print_help()
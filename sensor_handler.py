@@ -1,22 +1,186 @@
 import RPi.GPIO as GPIO
+import threading
 import time
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+# Fotografía inmutable del estado de los sensores. Se reemplaza completa en
+# cada cambio, por lo que los lectores nunca ven un estado a medio escribir.
+# `seq` crece en uno con cada transición publicada por el muestreador.
+SensorSnapshot = namedtuple('SensorSnapshot', ['active_sensors', 'status', 'timestamp', 'seq'])
+
 
 class SensorHandler:
-    def __init__(self):
-        self.SENSOR_PINS = [17, 27, 4, 5, 6, 13, 18, 22, 26, 19]
+    def __init__(self, pins=None):
+        self.SENSOR_PINS = list(pins) if pins else [17, 27, 4, 5, 6, 13, 18, 22, 26, 19]
+        # Cola de flancos (pin, nivel, timestamp). deque.append/popleft son
+        # atómicos, así que el callback de interrupción no toma ningún lock.
+        self.edge_events = deque()
+        self.edge_ready = threading.Event()
+        self.edge_detection = False
         GPIO.setmode(GPIO.BCM)
         self.setup_pins()
-        
+
     def setup_pins(self):
         for pin in self.SENSOR_PINS:
             GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-            
+
     def get_active_sensors(self):
         active = []
         for pin in self.SENSOR_PINS:
             if GPIO.input(pin):
                 active.append(pin)
         return active
-    
+
+    def make_snapshot(self, status, timestamp, seq=0):
+        # HIGH = producto retirado
+        active = tuple(pin for pin in self.SENSOR_PINS if status.get(pin) == GPIO.HIGH)
+        return SensorSnapshot(active, MappingProxyType(dict(status)), timestamp, seq)
+
+    def read_snapshot(self):
+        """Lee cada pin una sola vez y devuelve un SensorSnapshot."""
+        status = {pin: GPIO.input(pin) for pin in self.SENSOR_PINS}
+        return self.make_snapshot(status, time.time())
+
+    def enable_edge_detection(self, bouncetime=50):
+        """
+        Registra detección de flancos (subida y bajada) con antirrebote por
+        hardware en cada pin. Lanza RuntimeError si el kernel no la soporta.
+        """
+        added = []
+        try:
+            for pin in self.SENSOR_PINS:
+                GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._on_edge,
+                                      bouncetime=bouncetime)
+                added.append(pin)
+        except RuntimeError:
+            for pin in added:
+                GPIO.remove_event_detect(pin)
+            raise
+        self.edge_detection = True
+
+    def _on_edge(self, pin):
+        # Hilo de interrupciones de RPi.GPIO: tomar la hora y encolar, nada más.
+        timestamp = time.time()
+        self.edge_events.append((pin, GPIO.input(pin), timestamp))
+        self.edge_ready.set()
+
     def cleanup(self):
         GPIO.cleanup()
+
+
+class SensorSampler(threading.Thread):
+    """
+    Hilo que mantiene el último estado de los sensores como un SensorSnapshot
+    inmutable. Con `edge_detection` consume los flancos encolados por las
+    interrupciones GPIO (con su hora exacta) y relee todos los pines cada
+    `resync_interval` por si se perdió alguno; sin ella, o si el kernel no
+    soporta interrupciones, muestrea los pines cada `interval` segundos.
+
+    Los endpoints HTTP solo leen `snapshot`, sin tocar el bus GPIO. El
+    `timestamp` del snapshot es el de la última transición; `sampled_at` es
+    la hora de la última lectura, cambie o no el estado (si deja de avanzar,
+    el muestreador está detenido).
+    `on_change(active, previous, timestamp)` se invoca desde este hilo cada
+    vez que cambia el conjunto de sensores activos. Los suscriptores (p.ej.
+    el stream SSE) esperan transiciones con `wait_for_events`.
+    """
+
+    HISTORY_SIZE = 64
+
+    def __init__(self, handler, interval=0.02, on_change=None,
+                 edge_detection=False, bouncetime=50, resync_interval=1.0):
+        super().__init__(name='sensor-sampler', daemon=True)
+        self.handler = handler
+        self.interval = interval
+        self.on_change = on_change
+        self.edge_detection = edge_detection
+        self.bouncetime = bouncetime
+        self.resync_interval = resync_interval
+        self._stop_event = threading.Event()
+        # Estado vacío inicial: la primera lectura notifica los productos
+        # que ya estuvieran retirados al arrancar.
+        self._snapshot = SensorSnapshot((), MappingProxyType({}), time.time(), 0)
+        self.sampled_at = self._snapshot.timestamp
+        self._history = deque(maxlen=self.HISTORY_SIZE)
+        self._changed = threading.Condition()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def run(self):
+        if self.edge_detection:
+            try:
+                self.handler.enable_edge_detection(self.bouncetime)
+            except RuntimeError as e:
+                print(f"Detección de flancos no disponible, usando muestreo: {e}")
+                self.edge_detection = False
+
+        if self.edge_detection:
+            self._run_edges()
+        else:
+            self._run_polling()
+
+    def _run_polling(self):
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self._publish(self.handler.read_snapshot())
+            except Exception as e:
+                print(f"Error en muestreo de sensores: {e}")
+            elapsed = time.monotonic() - started
+            self._stop_event.wait(max(0.0, self.interval - elapsed))
+
+    def _run_edges(self):
+        handler = self.handler
+        self._publish(handler.read_snapshot())
+        while not self._stop_event.is_set():
+            handler.edge_ready.wait(self.resync_interval)
+            handler.edge_ready.clear()
+            try:
+                if not handler.edge_events:
+                    self._publish(handler.read_snapshot())
+                    continue
+                while handler.edge_events:
+                    pin, level, timestamp = handler.edge_events.popleft()
+                    status = dict(self._snapshot.status)
+                    status[pin] = level
+                    self._publish(handler.make_snapshot(status, timestamp))
+            except Exception as e:
+                print(f"Error procesando flancos de sensores: {e}")
+
+    def _publish(self, snapshot):
+        self.sampled_at = max(self.sampled_at, snapshot.timestamp)
+        previous = self._snapshot
+        if snapshot.status == previous.status:
+            return
+
+        snapshot = snapshot._replace(seq=previous.seq + 1)
+        with self._changed:
+            self._snapshot = snapshot
+            self._history.append(snapshot)
+            self._changed.notify_all()
+
+        if self.on_change and set(snapshot.active_sensors) != set(previous.active_sensors):
+            self.on_change(list(snapshot.active_sensors),
+                           list(previous.active_sensors),
+                           snapshot.timestamp)
+
+    def wait_for_events(self, last_seq, timeout=None):
+        """
+        Bloquea hasta que haya transiciones posteriores a `last_seq` y las
+        devuelve en orden. Si el suscriptor se atrasó más que el historial,
+        recibe solo la fotografía más reciente. Lista vacía si vence `timeout`.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._snapshot.seq > last_seq, timeout)
+            if self._snapshot.seq <= last_seq:
+                return []
+            events = [snap for snap in self._history if snap.seq > last_seq]
+            if not events or events[0].seq != last_seq + 1:
+                return [self._snapshot]
+            return events
+
+    def stop(self):
+        self._stop_event.set()
@@ -6,5 +6,5 @@ source /home/pi/vitrina/venv/bin/activate
 # Navegar al directorio de la aplicación
 cd /home/pi/vitrina
 
-# Iniciar la aplicación Flask
-python app.py >> /home/pi/vitrina/app.log 2>&1
+# Iniciar servidor web y tareas en segundo plano
+python vitrina.py run >> /home/pi/vitrina/app.log 2>&1
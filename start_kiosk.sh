@@ -14,9 +14,8 @@ unclutter -idle 0 -root &
 # Matar instancias previas de Chromium
 pkill -f chromium
 
-# Limpiar cache
-rm -rf ~/.cache/chromium/*
-rm -rf ~/.config/chromium/Default/Cache/*
+# No se limpia la caché: los videos se piden como /media/...?v=<hash>, así
+# que un archivo cacheado nunca queda desactualizado y sobrevive reinicios.
 
 # Iniciar Chromium con flags optimizadas
 chromium-browser \
@@ -41,6 +40,5 @@ chromium-browser \
   --enable-zero-copy \
   --ignore-gpu-blocklist \
   --enable-accelerated-video-decode \
-  --disk-cache-size=1 \
-  --media-cache-size=1 \
+  --disk-cache-size=1073741824 \
   http://localhost:5000
@@ -1,4 +1,4 @@
 #!/bin/bash
 cd /home/pi/vitrina
 source venv/bin/activate
-python app.py
+python vitrina.py run
@@ -15,6 +15,13 @@ function getFantasyNumber(gpio) {
     return gpioToFantasyMap[gpio] || gpio;
 }
 
+// Nombre del video para mostrar: los archivos se guardan como videos/<sha256>.mp4,
+// así que se usa el video_name que envía el servidor y la ruta solo como respaldo
+function videoDisplayName(item) {
+    if (item.video_name) return item.video_name;
+    return item.video_path ? item.video_path.split('/').pop().replace(/\.[^.]+$/, '') : '';
+}
+
 function formatNumber(number) {
     return new Intl.NumberFormat('es-AR').format(number);
 }
@@ -122,8 +129,8 @@ function updateDashboard(data) {
         );
         
         if (popularProductName) {
-            popularProductName.textContent = masPopular.nombre_fantasia || 
-                (masPopular.video_path ? masPopular.video_path.split('/').pop().replace('.mp4', '') : 'Sin nombre');
+            popularProductName.textContent = masPopular.nombre_fantasia ||
+                videoDisplayName(masPopular) || 'Sin nombre';
         }
         if (popularProductActivations) {
             popularProductActivations.textContent = masPopular.total || 0;
@@ -141,7 +148,7 @@ function updateDashboard(data) {
     if (historialBody) {
         if (data.activaciones_por_sensor && data.activaciones_por_sensor.length > 0) {
             historialBody.innerHTML = data.activaciones_por_sensor.map(item => {
-                const videoName = item.video_path ? item.video_path.split('/').pop().replace('.mp4', '') : 'Sin video';
+                const videoName = videoDisplayName(item) || 'Sin video';
                 const sensorName = item.nombre_fantasia || `Sensor ${item.sensor_id}`;
                 return `
                     <tr>
@@ -283,8 +290,7 @@ function updateSensorChart(activacionesPorSensor) {
     // Modificar cómo se generan las etiquetas para incluir el nombre de fantasía
     const labels = activacionesPorSensor.map(item => {
         const sensorNum = getFantasyNumber(item.sensor_id);
-        const nombreFantasia = item.nombre_fantasia || 
-                             (item.video_path ? item.video_path.split('/').pop().replace('.mp4', '') : '');
+        const nombreFantasia = item.nombre_fantasia || videoDisplayName(item);
         return nombreFantasia ? `Sensor ${sensorNum} - ${nombreFantasia}` : `Sensor ${sensorNum}`;
     });
 
@@ -374,9 +380,7 @@ function updateAssignmentHistory(data) {
                         asignacion.fecha_fin ? formatDateTime(asignacion.fecha_fin) : '-';
         
         // Obtener el nombre del video sin la extensión y la ruta
-        const videoName = asignacion.video_path ? 
-            asignacion.video_path.split('/').pop().replace('.mp4', '') : 
-            'Sin video asignado';
+        const videoName = videoDisplayName(asignacion) || 'Sin video asignado';
 
         const sensorName = asignacion.nombre_fantasia ? 
             `Sensor ${getFantasyNumber(asignacion.sensor_id)} - ${asignacion.nombre_fantasia}` : 
@@ -1,6 +1,8 @@
 // Variables globales y de estado (coloca esto al inicio del archivo)
 const SENSOR_PINS = [17, 27, 5, 6, 13, 18, 22, 26, 19];
-const SENSOR_CHECK_INTERVAL = 100; // Reducido de 250 a 100ms
+const SENSOR_CHECK_INTERVAL = 100; // Solo se usa si el stream SSE no está disponible
+const SENSOR_STREAM_URL = '/api/public/sensor_stream';
+const SENSOR_STREAM_MAX_ERRORS = 5; // Errores seguidos antes de volver a polling
 const DEBOUNCE_DELAY = 200; // Reducido de 500 a 200ms
 
 // Variables de conexión
@@ -21,6 +23,10 @@ let lastCheckTime = 0;
 let debounceTimeout = null;
 let debounceTimer = null;
 let assignedSensors = new Set();
+let sensorStream = null;
+let sensorStreamErrors = 0;
+let lastSensorSeq = -1;
+let pendingSensorData = null;
 
 // Variables de activación y timers
 let activationTimers = new Map();
@@ -43,6 +49,12 @@ function logError(error, context) {
     console.error(`Error in ${context}:`, error);
 }
 
+// URL versionada por hash (/media/...?v=) que el navegador cachea como
+// inmutable; /static/ como respaldo si el servidor no la envía
+function mediaUrl(item) {
+    return item.media_url || `/static/${item.video_path}`;
+}
+
 // Reemplazar initDebugPanel con una función vacía ya que no la necesitamos
 function initDebugPanel() {
     // No hacer nada
@@ -131,7 +143,7 @@ class BackgroundPlaylist {
             const currentVideo = this.playlist[this.currentIndex];
             
             // Precargar el video antes de reproducirlo
-            const videoPath = `/static/${currentVideo.video_path}`;
+            const videoPath = mediaUrl(currentVideo);
             await new Promise((resolve, reject) => {
                 this.video.src = videoPath;
                 this.video.load();
@@ -285,6 +297,21 @@ async function checkSensors() {
             throw new Error(`Error en sensor_status: ${response.status}`);
         }
 
+        await processSensorData(data);
+    } catch (error) {
+        debugLog(`Error en checkSensors: ${error.message}`);
+    }
+}
+
+// Aplica un estado de sensores recibido por polling o por el stream SSE
+async function processSensorData(data) {
+    if (isTransitioning) {
+        // Con push no hay un próximo poll que lo recupere: se guarda el último
+        pendingSensorData = data;
+        return;
+    }
+
+    try {
         const activeSensors = data.active_sensors || [];
         debugLog(`Estado actual de sensores: ${JSON.stringify(data.status)}`);
         debugLog(`Sensores activos: ${activeSensors.join(', ')}`);
@@ -303,7 +330,13 @@ async function checkSensors() {
             lastActiveSensors = [];
         }
     } catch (error) {
-        debugLog(`Error en checkSensors: ${error.message}`);
+        debugLog(`Error procesando sensores: ${error.message}`);
+    }
+
+    if (pendingSensorData && !isTransitioning) {
+        const pending = pendingSensorData;
+        pendingSensorData = null;
+        await processSensorData(pending);
     }
 }
 
@@ -332,7 +365,7 @@ async function switchToSingleMode(sensorId) {
         }
 
         // Configuración básica
-        mainVideo.src = `/static/${videoData.video_path}`;
+        mainVideo.src = mediaUrl(videoData);
         mainVideo.style.display = 'block';
         mainVideo.muted = true;
         mainVideo.loop = true;
@@ -468,8 +501,46 @@ function hideAllContainers() {
     if (quadScreen) quadScreen.style.display = 'none';
 }
 
+function startSensorStream() {
+    if (!window.EventSource) return false;
+
+    debugLog('Conectando al stream de sensores');
+    sensorStream = new EventSource(SENSOR_STREAM_URL);
+
+    // Una reconexión exitosa reinicia el conteo aunque los sensores no
+    // cambien (sin eventos, cortos cortes sueltos terminaban en polling)
+    sensorStream.onopen = () => {
+        sensorStreamErrors = 0;
+    };
+
+    sensorStream.addEventListener('sensors', (event) => {
+        sensorStreamErrors = 0;
+        const data = JSON.parse(event.data);
+        lastSensorSeq = data.seq;
+        debugLog(`Evento de sensores #${data.seq}: ${data.active_sensors.join(', ')}`);
+        processSensorData(data);
+    });
+
+    sensorStream.onerror = () => {
+        sensorStreamErrors++;
+        debugLog(`Error en stream de sensores (${sensorStreamErrors})`);
+        if (sensorStreamErrors >= SENSOR_STREAM_MAX_ERRORS) {
+            sensorStream.close();
+            sensorStream = null;
+            debugLog('Stream no disponible, usando polling');
+            startSensorPolling();
+        }
+    };
+    return true;
+}
+
 function startSensorMonitoring() {
     debugLog('Iniciando monitoreo de sensores');
+    if (startSensorStream()) return;
+    startSensorPolling();
+}
+
+function startSensorPolling() {
     if (window.sensorInterval) {
         clearInterval(window.sensorInterval);
         debugLog('Intervalo anterior limpiado');
@@ -647,8 +718,8 @@ async function switchToVersusMode(sensor1, sensor2) {
         const video1 = document.getElementById('video1');
         const video2 = document.getElementById('video2');
  
-        video1.src = `/static/${videos[0].video_path}`;
-        video2.src = `/static/${videos[1].video_path}`;
+        video1.src = mediaUrl(videos[0]);
+        video2.src = mediaUrl(videos[1]);
  
         video1.muted = localStorage.getItem(`sensor_${sensor1}_muted`) === 'true';
         video2.muted = localStorage.getItem(`sensor_${sensor2}_muted`) === 'true';
@@ -723,7 +794,7 @@ async function switchToTripleMode(sensors) {
         for (let i = 0; i < videos.length; i++) {
             const video = videoElements[i];
             if (video && videos[i]) {
-                video.src = `/static/${videos[i].video_path}`;
+                video.src = mediaUrl(videos[i]);
                 video.muted = localStorage.getItem(`sensor_${sensors[i]}_muted`) === 'true';
                 video.loop = true;
                 video.style.display = 'block';
@@ -763,7 +834,7 @@ async function switchToQuadMode(sensors) {
         for (let i = 0; i < videos.length; i++) {
             const video = videoElements[i];
             if (video && videos[i]) {
-                video.src = `/static/${videos[i].video_path}`;
+                video.src = mediaUrl(videos[i]);
                 video.muted = localStorage.getItem(`sensor_${sensors[i]}_muted`) === 'true';
                 video.loop = true;
                 video.style.display = 'block';
@@ -232,7 +232,7 @@ function createSensorCard(sensorId, videoInfo = {}, etiqueta = {}) {
                 <button class="save-name btn btn-primary">Guardar</button>
             </div>
             <div class="video-info">
-                <p>Video actual: ${videoInfo?.video_path ? videoInfo.video_path.split('/').pop() : 'Sin video'}</p>
+                <p>Video actual: ${videoInfo?.video_path ? (videoInfo.video_name || videoInfo.video_path.split('/').pop()) : 'Sin video'}</p>
                 <input type="file" id="video-${sensorId}" accept="video/*">
                 <div class="file-name">Ningún archivo seleccionado</div>
                 <div class="button-group">
@@ -425,7 +425,7 @@ async function loadBackgroundVideos() {
 }
 
 function createPlaylistItem(video, isFirst, isLast) {
-    const fileName = video.video_path.split('/').pop();
+    const fileName = video.video_name || video.video_path.split('/').pop();
     const div = document.createElement('div');
     div.className = 'playlist-item';
     div.innerHTML = `
@@ -165,7 +165,7 @@ class VideoPreloader {
                     .filter(v => v.video_path && this.isValidVideoPath(v.video_path))
                     .map(v => ({
                         id: `sensor-${v.sensor_id}`,
-                        path: `/static/${v.video_path}`
+                        path: v.media_url || `/static/${v.video_path}`
                     }));
                 videosToLoad.push(...validSensorVideos);
             }
@@ -175,7 +175,7 @@ class VideoPreloader {
                     .filter(v => v.video_path && this.isValidVideoPath(v.video_path))
                     .map(v => ({
                         id: `background-${v.id}`,
-                        path: `/static/${v.video_path}`
+                        path: v.media_url || `/static/${v.video_path}`
                     }));
                 videosToLoad.push(...validBackgroundVideos);
             }
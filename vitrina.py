@@ -0,0 +1,125 @@
+"""
+Punto de entrada de producción.
+
+    python -m vitrina run     # supervisor: lanza y vigila serve + jobs
+    python -m vitrina serve [--threads 8] [--port 5000] ...
+    python -m vitrina jobs    # CMS y reportes, con prioridad baja
+
+`serve` sirve la aplicación con waitress (multi-hilo, keep-alive y
+timeouts) en vez del servidor de desarrollo de Werkzeug. Es un solo proceso
+con varios hilos: el catálogo, la caché de respuestas, el stream SSE y el
+muestreador GPIO viven en memoria y deben ser únicos, por lo que no se usa
+pre-fork. `jobs` corre las tareas en segundo plano en otro proceso y avisa
+al servidor por el socket de ipc.py.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+SERVER_HOST = '0.0.0.0'
+SERVER_PORT = 5000
+SERVER_THREADS = 8  # cada kiosko/panel con stream SSE abierto ocupa un hilo
+SERVER_CONNECTION_LIMIT = 64  # conexiones simultáneas antes de rechazar
+SERVER_CHANNEL_TIMEOUT = 60  # segundos sin actividad antes de cerrar una conexión keep-alive
+SERVER_CLEANUP_INTERVAL = 15  # cada cuánto se revisan las conexiones inactivas
+SERVER_MAX_REQUEST_BODY = 500 * 1024 * 1024  # igual que MAX_CONTENT_LENGTH de Flask
+SUPERVISOR_RESTART_DELAY = 5  # segundos antes de relanzar un proceso que terminó
+
+
+def serve(args):
+    from waitress import serve as waitress_serve
+    import app
+
+    app.start_services()
+    print(f"Sirviendo en {args.host}:{args.port} con {args.threads} hilos")
+    waitress_serve(
+        app.app,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        channel_timeout=args.channel_timeout,
+        cleanup_interval=SERVER_CLEANUP_INTERVAL,
+        max_request_body_size=SERVER_MAX_REQUEST_BODY,
+        ident='vitrina',
+    )
+
+
+def jobs(args):
+    import jobs as background_jobs
+    background_jobs.run()
+
+
+def run(args):
+    """
+    Lanza `serve` y `jobs` como procesos hijos y relanza el que termine.
+    SIGTERM/SIGINT detienen ambos.
+    """
+    script = os.path.abspath(__file__)
+    commands = {
+        'serve': [sys.executable, script, 'serve', '--threads', str(args.threads),
+                  '--port', str(args.port)],
+        'jobs': [sys.executable, script, 'jobs'],
+    }
+    children = {}
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            for name, command in commands.items():
+                child = children.get(name)
+                if child is not None and child.poll() is None:
+                    continue
+                if child is not None:
+                    print(f"Proceso {name} terminó con código {child.returncode}, relanzando")
+                    time.sleep(SUPERVISOR_RESTART_DELAY)
+                    if stopping:
+                        break
+                children[name] = subprocess.Popen(command)
+            time.sleep(1)
+    finally:
+        for child in children.values():
+            if child.poll() is None:
+                child.terminate()
+        for child in children.values():
+            try:
+                child.wait(10)
+            except subprocess.TimeoutExpired:
+                child.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='vitrina', description='Vitrina Virtual TLaK')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='servidor web de producción (waitress)')
+    serve_parser.add_argument('--host', default=SERVER_HOST)
+    serve_parser.add_argument('--port', type=int, default=SERVER_PORT)
+    serve_parser.add_argument('--threads', type=int, default=SERVER_THREADS)
+    serve_parser.add_argument('--connection-limit', type=int, default=SERVER_CONNECTION_LIMIT)
+    serve_parser.add_argument('--channel-timeout', type=int, default=SERVER_CHANNEL_TIMEOUT)
+    serve_parser.set_defaults(func=serve)
+
+    jobs_parser = commands.add_parser('jobs', help='sincronización CMS y reportes')
+    jobs_parser.set_defaults(func=jobs)
+
+    run_parser = commands.add_parser('run', help='supervisor de serve + jobs')
+    run_parser.add_argument('--port', type=int, default=SERVER_PORT)
+    run_parser.add_argument('--threads', type=int, default=SERVER_THREADS)
+    run_parser.set_defaults(func=run)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,62 +2,201 @@ import sqlite3
 import http.client
 from flask import jsonify
 import os
+import gzip
 import json
+import random
+import time
+from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+import database
+import ipc
+import report_outbox
 from credential_manager import credential_manager as credentials
 
-def POST_JSON(url, data):
+REPORT_URL = "https://clientes.tecnoactive.cl/liftandlearn2/api.php?action=report_activations"
+REPORT_BATCH_SIZE = 500  # activaciones leídas del outbox por vuelta
+REPORT_MAX_PAYLOAD = 256 * 1024  # bytes de NDJSON (sin comprimir) por petición
+REPORT_COMPRESS_LEVEL = 6
+REPORT_TIMEOUT = (10, 30)  # (conexión, lectura) en segundos
+REPORT_RETRIES = 4
+REPORT_RETRY_DELAY = 2  # segundos; se duplica en cada reintento, con jitter
+
+# Una sola sesión: keep-alive al servidor de reportes entre peticiones y ciclos
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+def ndjson_chunks(batch, max_bytes=REPORT_MAX_PAYLOAD):
+    """
+    Parte el lote en trozos de a lo más `max_bytes` de NDJSON (una
+    activación por línea). Devuelve (sub-lote, cuerpo gzip o None si el
+    sub-lote solo tiene activaciones borradas, bytes sin comprimir).
+    """
+    def compress(lines):
+        body = b''.join(lines)
+        return gzip.compress(body, REPORT_COMPRESS_LEVEL) if body else None, len(body)
+
+    chunk, lines, size = [], [], 0
+    for entry in batch:
+        item = entry[1]
+        line = b'' if item is None else (
+            json.dumps(item, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+        if chunk and size + len(line) > max_bytes:
+            yield (chunk, *compress(lines))
+            chunk, lines, size = [], [], 0
+        chunk.append(entry)
+        lines.append(line)
+        size += len(line)
+    if chunk:
+        yield (chunk, *compress(lines))
+
+def POST_NDJSON(url, body):
+    """
+    POST de un cuerpo NDJSON comprimido. Reintenta errores de red, 429 y
+    5xx con backoff exponencial y jitter; un 4xx no se reintenta.
+    Devuelve (status, respuesta) o (None, None) si se agotaron los intentos.
+    """
+    headers = {
+        'Content-Type': 'application/x-ndjson',
+        'Content-Encoding': 'gzip',
+    }
+    delay = REPORT_RETRY_DELAY
+    status, response_body = None, None
+    for attempt in range(1, REPORT_RETRIES + 1):
+        try:
+            print(f'posting activation data ({len(body)} bytes)...')
+            response = session.post(url, data=body, headers=headers, timeout=REPORT_TIMEOUT)
+            status = response.status_code
+            if status == 200:
+                try:
+                    return status, response.json()
+                except ValueError:
+                    return status, response.text
+            print(f"Error: Received status code {status}")
+            response_body = response.text
+            if status != 429 and status < 500:
+                return status, response_body
+        except requests.RequestException as e:
+            print(f"Error sending data (intento {attempt}/{REPORT_RETRIES}): {e}")
+            status, response_body = None, None
+        if attempt < REPORT_RETRIES:
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+    return status, response_body
+
+def debug_enabled():
+    """system_config.debug_enabled; solo entonces se guardan result.json y response.json."""
     try:
-        json_data = json.dumps(data)
-
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        print('posting activation data...')
-        response = requests.post(url, data=json_data, headers=headers)
-        
-        if response.status_code == 200:
-            return response.status_code, response.json()
-        else:
-            print(f"Error: Received status code {response.status_code}")
-            return response.status_code, response.text
-    except Exception as e:
-        print(f"Error sending data: {e}")
-        return None, None
+        with database.connection() as conn:
+            row = conn.execute("SELECT value FROM system_config WHERE key = 'debug_enabled'").fetchone()
+        return bool(row) and str(row[0]).lower() in ('true', '1')
+    except sqlite3.Error:
+        return False
 
-def get_activaciones_recientes():
+def dump_debug(filename, data):
+    try:
+        with open(os.path.join(os.path.dirname(__file__), filename), 'w') as f:
+            json.dump(data, f, indent=4)
+    except OSError as e:
+        print(f"No se pudo escribir {filename}: {e}")
+
+def record_attempt(rows, raw_bytes, payload_bytes, latency, status, response_body):
+    """
+    Informa un intento de envío al servidor web, que guarda los últimos en
+    memoria (/api/report-attempts) en vez de escribirlos en la SD.
+    """
+    attempt = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'rows': rows,
+        'raw_bytes': raw_bytes,
+        'payload_bytes': payload_bytes,
+        'latency_ms': round(latency * 1000),
+        'status': status,
+    }
+    if status != 200:
+        attempt['error'] = str(response_body)[:200] if response_body is not None else None
+    ipc.notify({'type': 'report_attempt', **attempt})
+
+def get_activaciones_pendientes(limit=REPORT_BATCH_SIZE, debug=False):
+    """
+    Siguiente lote del outbox: lista de (outbox_id, activación) donde la
+    activación es None si ya no existe. Cada activación lleva su
+    idempotency_key para que el servidor descarte las que ya recibió.
+    """
     try:
         print('getting data from db')
         credentials_data = credentials.get_credentials()
-        with sqlite3.connect('/home/pi/vitrina/vitrina.db') as conn:
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            c.execute("SELECT * FROM v_activaciones WHERE timestamp >= DATETIME('now', '-12 minute', 'localtime') AND completed = 1") # cambiar a -1 hour
-            rows = c.fetchall()
-            
-            result = [dict(row) for row in rows]
-            print('assigning ids')
-            for item in result:
+        batch = report_outbox.pending(limit)
+        for outbox_id, item in batch:
+            if item is not None:
                 item['device_id'] = credentials_data["device_id"]
 
-            with open(os.path.join(os.path.dirname(__file__), 'result.json'), 'w') as f:
-                json.dump(result, f, indent=4)
+        if debug:
+            dump_debug('result.json', [item for _, item in batch])
 
-            return result
+        return batch
 
     except Exception as e:
-        return False
+        print(f"Error leyendo activaciones pendientes: {e}")
+        return None
+
+def acknowledged_until(batch, status, response_body):
+    """
+    outbox_id hasta el que el servidor confirmó el lote, o None. Si la
+    respuesta trae `acknowledged` (claves de idempotencia recibidas), solo
+    cuenta el prefijo confirmado; si no, un 200 confirma el lote completo.
+    """
+    if status != 200:
+        return None
+    keys = response_body.get('acknowledged') if isinstance(response_body, dict) else None
+    if keys is None:
+        return batch[-1][0]
+    keys = set(keys)
+    last = None
+    for outbox_id, item in batch:
+        if item is not None and item['idempotency_key'] not in keys:
+            break
+        last = outbox_id
+    return last
 
 def send_data_to_server():
-    activaciones_recientes = get_activaciones_recientes()
-    status, response_body = POST_JSON("https://clientes.tecnoactive.cl/liftandlearn2/api.php?action=report_activations", activaciones_recientes)
-    with open(os.path.join(os.path.dirname(__file__), 'response.json'), 'w') as f:
-        json.dump(response_body, f, indent=4)
-
-    if status == 200:
-        print("OK, Server response:", response_body)
-    else:
-        print(f"Error Server response: {response_body}")
+    """
+    Envía todo lo que está después del cursor, en trozos acotados, y lo
+    avanza con cada confirmación. Si un trozo falla, se corta y el próximo
+    ciclo reintenta desde el mismo punto: un atraso de varios días se vacía
+    en varias peticiones en vez de una gigante.
+    """
+    status, response_body = None, None
+    debug = debug_enabled()
+    while True:
+        batch = get_activaciones_pendientes(debug=debug)
+        if batch is None:
+            return status, response_body
+        if not batch:
+            break
+        for chunk, body, raw_bytes in ndjson_chunks(batch):
+            rows = sum(1 for _, item in chunk if item is not None)
+            if body is not None:
+                started = time.monotonic()
+                status, response_body = POST_NDJSON(REPORT_URL, body)
+                record_attempt(rows, raw_bytes, len(body), time.monotonic() - started,
+                               status, response_body)
+                if debug:
+                    dump_debug('response.json', response_body)
+            else:
+                # Solo activaciones borradas: nada que enviar, se avanza el cursor
+                status, response_body = 200, None
+
+            until = acknowledged_until(chunk, status, response_body)
+            if until is None:
+                print(f"Error Server response: {response_body}")
+                return status, response_body
+            report_outbox.acknowledge(until)
+            print(f"OK, {rows} activaciones reportadas, Server response:", response_body)
+            if until != chunk[-1][0]:
+                return status, response_body
+
+    report_outbox.prune()
     return status, response_body
 
 if __name__ == "__main__":